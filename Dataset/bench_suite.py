@@ -0,0 +1,276 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from itertools import islice
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from portion_solver import solution_cache
+from profiles import sample_profiles
+from recipe_data import load_recipe_dataset
+from recipe_store import RecipeStore
+from recommend import (
+    FeasibilityScreen, extract_ingredients, file_hash, load_ingredient_table, meal_target_macros,
+    nutrition_target_vector, optimize_ingredient_weights, optimize_ingredient_weights_batch, suggest_diet,
+)
+from similarity_index import SimilarityIndex
+from synthetic_recipes import ensure_corpus
+from worker_pool import start_solve_executor
+
+# -------------------------------------------
+# Benchmark suite over synthetic corpora
+# -------------------------------------------
+# Every case returns a list of per-call seconds; results are summarized per
+# (case, corpus size) and compared by median against a saved baseline.
+def summarize(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'n': int(len(samples)),
+        'mean': float(samples.mean()),
+        'median': float(np.median(samples)),
+        'p95': float(np.percentile(samples, 95)),
+        'min': float(samples.min()),
+    }
+
+def timed_calls(fn, calls, block=1):
+    """
+    Seconds per call; calls too fast to time one by one are timed ``block`` at a time and averaged
+    """
+    seconds = []
+    for b in range(0, len(calls), block):
+        batch = calls[b:b + block]
+        start = time.perf_counter()
+        for args in batch:
+            fn(*args)
+        seconds.append((time.perf_counter() - start) / len(batch))
+    return seconds
+
+def bench_extract_ingredients(store, rows, seed=0):
+    positions = np.random.default_rng(seed).choice(len(store), min(rows, len(store)), replace=False)
+    records = [store.row(int(pos)) for pos in positions]
+    return timed_calls(extract_ingredients, [(r,) for r in records], block=25)
+
+def solver_problems(store, table, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.choice(store.frame.index.to_numpy(), min(rows, len(store)), replace=False)
+    ingredient_lists = [ings for ings in (table.lookup(i) for i in ids) if ings]
+    targets = rng.uniform(200, 800, len(ingredient_lists)).tolist()
+    return ingredient_lists, targets
+
+def bench_optimize_slsqp(store, table, rows, seed=0):
+    ingredient_lists, targets = solver_problems(store, table, rows, seed)
+    return timed_calls(
+        optimize_ingredient_weights,
+        [(ings, meal_target_macros(t), '', t) for ings, t in zip(ingredient_lists, targets)],
+    )
+
+def bench_optimize_lsq(store, table, rows, seed=0, batch_size=8):
+    """
+    Seconds per recipe of cold batched solves (batch of suggest_diet's size)
+    """
+    ingredient_lists, targets = solver_problems(store, table, rows, seed)
+    solution_cache.clear()
+    seconds = []
+    for b in range(0, len(targets), batch_size):
+        batch_targets = targets[b:b + batch_size]
+        start = time.perf_counter()
+        optimize_ingredient_weights_batch(
+            ingredient_lists[b:b + batch_size], [meal_target_macros(t) for t in batch_targets], batch_targets
+        )
+        seconds.append((time.perf_counter() - start) / len(batch_targets))
+    return seconds
+
+def bench_rank(store, profiles, top=20, seed=0):
+    """
+    Seconds per request to find the ``top`` recipes of the user's partition:
+    float64 cosine over every row (the pre-index path), the exact index, and
+    the approximate index. Returns the three sample lists and the mean share
+    of the exact top ``top`` that the approximate index also returned.
+    """
+    rng = np.random.default_rng(seed)
+    calls = []
+    for profile in profiles:
+        partition = store.partition(profile['Type'], profile['meal_type'])
+        if partition is not None:
+            calls.append((partition, nutrition_target_vector(rng.uniform(1200, 3500))))
+    partitions = {id(p): p for p, _ in calls}
+    scaled = {key: p.index.scale(p.nutrients) for key, p in partitions.items()}
+    approximate = {key: SimilarityIndex(p.nutrients, p.index.factors, p.index.offsets, approximate=True)
+                   for key, p in partitions.items()}
+
+    def cosine(partition, target_vec):
+        candidates = np.arange(len(partition))
+        sim = cosine_similarity(partition.index.scale(np.asarray([target_vec], dtype=np.float64)),
+                                scaled[id(partition)][candidates])[0]
+        best = np.argpartition(-sim, min(top, len(sim) - 1))[:top]
+        return best[np.lexsort((best, -sim[best]))].tolist()
+
+    def ranked(index, target_vec):
+        return list(islice(index.ranked(target_vec, np.arange(len(index)), top), top))
+
+    exact = timed_calls(lambda p, t: ranked(p.index, t), calls)
+    approx = timed_calls(lambda p, t: ranked(approximate[id(p)], t), calls)
+    recall = np.mean([len(set(ranked(p.index, t)) & set(ranked(approximate[id(p)], t))) / min(top, len(p))
+                      for p, t in calls])
+    return timed_calls(cosine, calls), exact, approx, float(recall)
+
+def bench_suggest_diet(store, table, feasibility, profiles, solver='slsqp', executor=None, speculate=0):
+    def run(profile):
+        profile = dict(profile)
+        suggest_diet(profile, store, exclude_recipe_names=profile.pop('exclude_recipe_names'),
+                     exclude_recipe_ids=profile.pop('exclude_recipe_ids'), ingredient_table=table,
+                     feasibility=feasibility, solver=solver, executor=executor, speculate=speculate)
+    return timed_calls(run, [(p,) for p in profiles])
+
+# Serves /recommend from a fresh interpreter (startup counts until /health/ready
+# answers 200) and times in-process requests through the ASGI app, so no
+# server or port is needed
+ENDPOINT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    while client.get('/health/ready').status_code != 200:
+        time.sleep(0.01)
+    startup = time.perf_counter() - start
+    seconds, errors = [], 0
+    for profile in json.load(sys.stdin):
+        start = time.perf_counter()
+        response = client.post('/recommend', json=profile)
+        seconds.append(time.perf_counter() - start)
+        errors += response.status_code != 200 or response.json().get('message', '').startswith('Error')
+print(json.dumps({'startup': startup, 'seconds': seconds, 'errors': errors}))
+"""
+
+def bench_recommend_endpoint(recipe_path, profiles):
+    env = dict(os.environ, RECIPE_PATH=recipe_path, RESPONSE_CACHE_SIZE='0', PORTION_CACHE_SIZE='0',
+               PORTION_CACHE_PATH=recipe_path + '.portion_cache.json', EXECUTION_MODE='thread')
+    result = subprocess.run([sys.executable, '-c', ENDPOINT_SCRIPT], input=json.dumps(profiles),
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"/recommend benchmark failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+def run_size(rows, args):
+    """
+    Summaries of every case on the corpus with ``rows`` recipes
+    """
+    recipe_path = ensure_corpus(args.data_dir, rows, args.seed)
+    results = {}
+
+    start = time.perf_counter()
+    store = RecipeStore(*load_recipe_dataset(recipe_path, file_hash(recipe_path)))
+    table = load_ingredient_table(recipe_path)
+    feasibility = FeasibilityScreen(table)
+    results['load'] = summarize([time.perf_counter() - start])  # includes the one-off export/build on first run
+
+    profiles = sample_profiles(args.requests, args.seed, max_recipe_id=len(store))
+    suggest_diet(dict(profiles[0], exclude_recipe_ids=[], exclude_recipe_names=[]), store)  # warm-up
+    results['extract_ingredients'] = summarize(bench_extract_ingredients(store, args.solves * 5, args.seed))
+    results['optimize_slsqp'] = summarize(bench_optimize_slsqp(store, table, args.solves, args.seed))
+    results['optimize_lsq'] = summarize(bench_optimize_lsq(store, table, args.solves, args.seed))
+    cosine, exact, approximate, recall = bench_rank(store, profiles, seed=args.seed)
+    results['rank_cosine'] = summarize(cosine)
+    results['rank_exact'] = summarize(exact)
+    results['rank_approximate'] = summarize(approximate)
+    results['rank_approximate']['recall'] = recall
+    results['suggest_diet'] = summarize(bench_suggest_diet(store, table, feasibility, profiles))
+    if args.speculate > 1:
+        executor = start_solve_executor('process', args.speculate_workers)
+        results['suggest_diet_speculative'] = summarize(
+            bench_suggest_diet(store, table, feasibility, profiles, executor=executor, speculate=args.speculate)
+        )
+        executor.shutdown()
+    del store, table, feasibility
+    gc.collect()
+
+    if not args.skip_endpoint:
+        endpoint = bench_recommend_endpoint(recipe_path, profiles)
+        results['recommend_startup'] = summarize([endpoint['startup']])
+        results['recommend_endpoint'] = summarize(endpoint['seconds'])
+        results['recommend_endpoint']['errors'] = endpoint['errors']
+    return results
+
+# Slowdowns smaller than this are never regressions
+MIN_DELTA_SECONDS = 50e-6
+
+def compare(results, baseline, threshold, min_delta=MIN_DELTA_SECONDS):
+    """
+    (name, baseline median, current median) of every case slower than
+    ``threshold`` (0.25 = 25%) relative to the baseline and by more than
+    ``min_delta`` seconds, so timer noise on microsecond cases is not reported
+    """
+    regressions = []
+    for size, cases in results.items():
+        for case, summary in cases.items():
+            before = baseline.get(size, {}).get(case)
+            if case == 'load' or before is None:
+                continue  # load time depends on whether artifacts were already built
+            if summary['median'] > before['median'] * (1 + threshold) + min_delta:
+                regressions.append((f"{case}@{size}", before['median'], summary['median']))
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark suite on synthetic recipe corpora")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--data-dir', default='bench_data')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=30, help="sampled profiles per size")
+    parser.add_argument('--solves', type=int, default=100, help="portion solves per solver case")
+    parser.add_argument('--skip-endpoint', action='store_true')
+    parser.add_argument('--speculate', type=int, default=0,
+                        help="also time suggest_diet solving this many candidates concurrently")
+    parser.add_argument('--speculate-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None, help="earlier --output file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed median slowdown, 0.25 = 25%%")
+    parser.add_argument('--min-delta-ms', type=float, default=MIN_DELTA_SECONDS * 1e3,
+                        help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+    for rows in args.sizes:
+        print(f"🔄 Benchmarking {rows} recipes")
+        cases = report['results'][str(rows)] = run_size(rows, args)
+        for case, summary in cases.items():
+            print(f"   {case:20s}: median {summary['median'] * 1e3:10.2f} ms, "
+                  f"p95 {summary['p95'] * 1e3:10.2f} ms (n={summary['n']})")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results -> {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(report['results'], baseline, args.threshold, args.min_delta_ms / 1e3)
+        for name, before, after in regressions:
+            print(f"❌ {name}: median {before * 1e3:.2f} ms -> {after * 1e3:.2f} ms (+{(after / before - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No case slower than {args.threshold * 100:.0f}% over {args.baseline}")
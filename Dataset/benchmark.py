@@ -0,0 +1,288 @@
+import argparse
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import MinMaxScaler
+
+from recipe_data import read_recipes
+from recipe_store import RECIPE_NUTRIENT_COLUMNS, RecipeStore
+from portion_solver import solution_cache
+from recommend import (
+    calculate_actual_nutrition, extract_ingredients, meal_target_macros, nutrient,
+    optimize_ingredient_weights, optimize_ingredient_weights_batch, recipe_text,
+)
+
+# -------------------------------------------
+# Reference implementations (pre-optimization)
+# -------------------------------------------
+def extract_ingredients_regex_scan(row):
+    """
+    Original extraction: one regex search per nutrient-database food
+    """
+    combined_text = recipe_text(row).lower()
+    found_ings = []
+    for ingredient in nutrient['food'].str.lower():
+        if re.search(rf'\b{re.escape(ingredient)}\b', combined_text):
+            found_ings.append(ingredient)
+    return found_ings
+
+def rank_candidates_copy(recipe_df, user_input, target_vec):
+    """
+    Original candidate preparation: copy, filter, coerce and fit a scaler per request
+    """
+    df = recipe_df.copy()
+    df = df[df['Type'].str.lower() == user_input['Type'].lower()]
+    df = df[df['MealType'].str.lower() == user_input['meal_type'].lower()]
+    df = df.dropna(subset=RECIPE_NUTRIENT_COLUMNS)
+    df[RECIPE_NUTRIENT_COLUMNS] = df[RECIPE_NUTRIENT_COLUMNS].apply(pd.to_numeric, errors='coerce')
+    df = df.dropna(subset=RECIPE_NUTRIENT_COLUMNS)
+    scaler = MinMaxScaler()
+    scaled = scaler.fit_transform(df[RECIPE_NUTRIENT_COLUMNS].to_numpy())
+    return cosine_similarity(scaler.transform([target_vec]), scaled)[0]
+
+def rank_candidates_store(store, user_input, target_vec):
+    partition = store.partition(user_input['Type'], user_input['meal_type'])
+    candidates = np.arange(len(partition))
+    return list(islice(partition.index.ranked(target_vec, candidates), 20))
+
+def health_condition_mask_scan(df, user_input):
+    """
+    Original health-condition filter: str.contains scans on every request
+    """
+    keep = np.ones(len(df), dtype=bool)
+    for cond in [c.lower() for c in user_input.get('health_conditions', [])]:
+        if cond == 'diabetes':
+            keep &= (df['SugarContent'] <= 10).to_numpy()
+        elif cond == 'hypertension':
+            keep &= (df['SodiumContent'] <= 400).to_numpy()
+        elif cond == 'asthma':
+            keep &= ~df['RecipeInstructions'].astype(str).str.contains('dairy', na=False, case=False).to_numpy()
+        elif cond == 'allergy':
+            for allergen in [a.lower() for a in user_input.get('allergies', [])]:
+                keep &= ~df['RecipeInstructions'].astype(str).str.contains(allergen, na=False, case=False).to_numpy()
+                if 'RecipeIngredientParts' in df.columns:
+                    keep &= ~df['RecipeIngredientParts'].astype(str).str.contains(allergen, na=False, case=False).to_numpy()
+    return keep
+
+# -------------------------------------------
+# Benchmarks
+# -------------------------------------------
+BENCH_PROFILES = [
+    {'Type': diet_type, 'meal_type': meal_type}
+    for diet_type in ('vegetarian', 'non-vegetarian')
+    for meal_type in ('breakfast', 'lunch', 'dinner', 'snack', 'general')
+]
+BENCH_TARGET = [2000, 2000 * 0.25 / 9, 2000 * 0.5 / 4, 2000 * 0.25 / 4, 2000 * 0.035]
+
+def time_and_peak_memory(fn, calls):
+    """
+    Mean seconds per call and mean tracemalloc peak bytes per call
+    """
+    elapsed, peaks = 0.0, []
+    for args in calls:
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(*args)
+        elapsed += time.perf_counter() - start
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return elapsed / len(calls), sum(peaks) / len(peaks)
+
+def time_per_item(fn, items):
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return (time.perf_counter() - start) / max(len(items), 1), results
+
+def bench_extract_ingredients(recipe_df, rows=2000):
+    """
+    Per-recipe ingredient matching latency: regex scan vs compiled index
+    """
+    records = recipe_df.head(rows).to_dict('records')
+    before, expected = time_per_item(extract_ingredients_regex_scan, records)
+    after, actual = time_per_item(extract_ingredients, records)
+
+    mismatches = sum(set(a) != set(b) for a, b in zip(expected, actual))
+    print(f"extract_ingredients over {len(records)} recipes")
+    print(f"   regex scan : {before * 1e6:9.1f} µs/recipe")
+    print(f"   index      : {after * 1e6:9.1f} µs/recipe  ({before / after:.1f}x)")
+    print(f"   mismatched ingredient sets: {mismatches}")
+
+def bench_recipe_store(recipe_df, repeat=5):
+    """
+    Per-request candidate ranking: copy-and-refit vs prepared RecipeStore partitions
+    """
+    start = time.perf_counter()
+    store = RecipeStore(recipe_df)
+    build_time = time.perf_counter() - start
+
+    copy_calls = [(recipe_df, p, BENCH_TARGET) for p in BENCH_PROFILES] * repeat
+    store_calls = [(store, p, BENCH_TARGET) for p in BENCH_PROFILES] * repeat
+    before, before_peak = time_and_peak_memory(rank_candidates_copy, copy_calls)
+    after, after_peak = time_and_peak_memory(rank_candidates_store, store_calls)
+
+    print(f"candidate ranking over {len(recipe_df)} recipes ({len(copy_calls)} requests)")
+    print(f"   store build       : {build_time * 1e3:9.1f} ms once, "
+          f"{store.memory_usage() / 1e6:.1f} MB resident "
+          f"(raw frame {recipe_df.memory_usage(deep=True).sum() / 1e6:.1f} MB)")
+    print(f"   copy + refit      : {before * 1e3:9.2f} ms/request, peak {before_peak / 1e6:8.2f} MB allocated")
+    print(f"   RecipeStore       : {after * 1e3:9.2f} ms/request, peak {after_peak / 1e6:8.2f} MB allocated "
+          f"({before / after:.1f}x)")
+
+BENCH_ALLERGENS = ['milk', 'egg', 'peanut', 'nut', 'wheat', 'soy', 'fish', 'shrimp', 'sesame', 'mustard',
+                   'celery', 'butter', 'cheese', 'almond', 'cashew', 'walnut', 'shellfish', 'gluten', 'oat', 'corn']
+
+def bench_condition_filters(recipe_df, repeat=3):
+    """
+    Health-condition filtering: per-request text scans vs precomputed masks and allergen index
+    """
+    store = RecipeStore(recipe_df)
+    start = time.perf_counter()
+    store.token_index
+    index_time = time.perf_counter() - start
+
+    print(f"health-condition filters over {len(store)} recipes "
+          f"(allergen index built in {index_time * 1e3:.0f} ms, "
+          f"{len(store.token_index.vocab)} tokens)")
+    for conditions, allergens in [(['asthma', 'diabetes', 'hypertension'], []),
+                                  (['allergy'], BENCH_ALLERGENS[:3]),
+                                  (['allergy', 'asthma'], BENCH_ALLERGENS)]:
+        calls = [dict(p, health_conditions=conditions, allergies=allergens) for p in BENCH_PROFILES] * repeat
+        partitions = [store.partition(p['Type'], p['meal_type']) for p in calls]
+        calls = [(p, part) for p, part in zip(calls, partitions) if part is not None]
+
+        before, expected = time_per_item(lambda c: health_condition_mask_scan(c[1].frame, c[0]), calls)
+        store.token_index.terms.clear()  # time the first lookup of each allergen too
+        after, actual = time_per_item(
+            lambda c: store.condition_mask(c[1], c[0]['health_conditions'], c[0]['allergies']), calls
+        )
+        mismatches = sum(not np.array_equal(e, a) for e, a in zip(expected, actual))
+        print(f"   {'+'.join(conditions)} with {len(allergens)} allergens")
+        print(f"      text scans : {before * 1e3:8.2f} ms/request")
+        print(f"      masks      : {after * 1e3:8.2f} ms/request ({before / after:.1f}x), mismatches {mismatches}")
+
+def bench_exclusion(recipe_df, sizes=(100, 1000, 10000), repeat=5, seed=0):
+    """
+    Excluding already-seen recipes: Name.isin on strings vs a recipe id mask
+    """
+    store = RecipeStore(recipe_df)
+    rng = np.random.default_rng(seed)
+    partitions = [store.partition(p['Type'], p['meal_type']) for p in BENCH_PROFILES]
+    partitions = [p for p in partitions if p is not None] * repeat
+
+    print(f"recipe exclusion over {len(store)} recipes")
+    for size in sizes:
+        ids = rng.choice(store.frame.index.to_numpy(), min(size, len(store)), replace=False)
+        names = store.frame.loc[ids, 'Name'].tolist()
+        by_name, _ = time_per_item(lambda p: p.frame['Name'].isin(names).to_numpy(), partitions)
+        by_id, _ = time_per_item(lambda p: store.exclusion_mask(p, ids), partitions)
+        print(f"   {len(ids):6d} excluded: names {by_name * 1e3:7.3f} ms, ids {by_id * 1e3:7.3f} ms "
+              f"({by_name / by_id:.1f}x)")
+
+# Run in a fresh interpreter per format so RSS reflects only that load path
+LOAD_SCRIPT = """
+import time
+from recipe_data import load_recipe_dataset, read_recipes
+from recipe_store import RecipeStore
+from recommend import file_hash
+start = time.perf_counter()
+path = {path!r}
+if {fmt!r} == 'csv':
+    store = RecipeStore(read_recipes(path))
+else:
+    store = RecipeStore(*load_recipe_dataset(path, file_hash(path)))
+elapsed = time.perf_counter() - start
+rss = [line for line in open('/proc/self/status') if line.startswith('VmRSS')][0].split()[1]
+print(elapsed, int(rss) * 1024)
+"""
+
+def bench_dataset_load(recipe_path):
+    """
+    Startup time and resident memory: CSV parse vs binary export with mapped text
+    """
+    baseline = subprocess.run([sys.executable, '-c', 'import recommend; print(0, [l for l in open("/proc/self/status") '
+                               'if l.startswith("VmRSS")][0].split()[1])'], capture_output=True, text=True)
+    base_rss = int(baseline.stdout.split()[-1]) * 1024
+    print(f"dataset load from {recipe_path} (RSS after importing recommend: {base_rss / 1e6:.0f} MB)")
+    # The first binary run exports the dataset if needed; measure the warm load
+    for fmt in ('csv', 'binary', 'binary'):
+        result = subprocess.run([sys.executable, '-c', LOAD_SCRIPT.format(path=recipe_path, fmt=fmt)],
+                                capture_output=True, text=True)
+        elapsed, rss = result.stdout.split()[-2:]
+        print(f"   {fmt:6s} : {float(elapsed):7.2f} s to a ready RecipeStore, RSS {int(rss) / 1e6:7.1f} MB "
+              f"(+{(int(rss) - base_rss) / 1e6:.1f} MB)")
+
+def calorie_match_rate(solved, target_calories):
+    accepted = 0
+    for (rows, grams), target in zip(solved, target_calories):
+        ratio = calculate_actual_nutrition(rows, grams)['calories'] / target
+        accepted += 0.95 <= ratio <= 1.05 and len(rows) > 0
+    return accepted / len(solved)
+
+def bench_portion_solver(recipe_df, rows=300, batch_size=64, seed=0):
+    """
+    Portion solve time and calorie-match acceptance: SLSQP vs batched least squares
+    """
+    rng = np.random.default_rng(seed)
+    records = recipe_df.sample(min(rows, len(recipe_df)), random_state=seed).to_dict('records')
+    ingredient_lists = [extract_ingredients(r) for r in records]
+    targets = rng.uniform(200, 800, len(records)).tolist()
+    macros = [meal_target_macros(t) for t in targets]
+
+    start = time.perf_counter()
+    reference = [optimize_ingredient_weights(i, m, '', t) for i, m, t in zip(ingredient_lists, macros, targets)]
+    slsqp = (time.perf_counter() - start) / len(records)
+
+    def run_batched():
+        solved = []
+        start = time.perf_counter()
+        for b in range(0, len(records), batch_size):
+            solved += optimize_ingredient_weights_batch(
+                ingredient_lists[b:b + batch_size], macros[b:b + batch_size], targets[b:b + batch_size]
+            )
+        return solved, (time.perf_counter() - start) / len(records)
+
+    reference_rate = calorie_match_rate(reference, targets)
+
+    solution_cache.clear()
+    cold, cold_time = run_batched()
+    cold_rate = calorie_match_rate(cold, targets)
+    # The same problems again come from the solution cache
+    again, again_time = run_batched()
+    again_rate = calorie_match_rate(again, targets)
+    # Same ingredient sets with new targets are warm-started from the cached solutions
+    targets = [t * rng.uniform(0.9, 1.1) for t in targets]
+    macros = [meal_target_macros(t) for t in targets]
+    warm, warm_time = run_batched()
+    solution_cache.clear()
+    differ = sum(not np.array_equal(w[1], c[1]) for w, c in zip(warm, run_batched()[0]))
+
+    print(f"portion solver over {len(records)} recipes (batch {batch_size})")
+    print(f"   SLSQP        : {slsqp * 1e3:8.2f} ms/recipe, calorie match {reference_rate * 100:5.1f}%")
+    print(f"   batched cold : {cold_time * 1e3:8.2f} ms/recipe ({slsqp / cold_time:.1f}x), "
+          f"calorie match {cold_rate * 100:5.1f}%")
+    print(f"   batched again: {again_time * 1e3:8.2f} ms/recipe ({slsqp / again_time:.1f}x), "
+          f"calorie match {again_rate * 100:5.1f}%")
+    print(f"   batched warm : {warm_time * 1e3:8.2f} ms/recipe ({slsqp / warm_time:.1f}x), "
+          f"calorie match {calorie_match_rate(warm, targets) * 100:5.1f}%, "
+          f"{differ} of {len(records)} portions differ from a cold solve")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation pipeline")
+    parser.add_argument('--recipes', default='cleaned_recipes.csv')
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    bench_dataset_load(args.recipes)
+    recipe = read_recipes(args.recipes)
+    bench_extract_ingredients(recipe, args.rows)
+    bench_recipe_store(recipe)
+    bench_condition_filters(recipe)
+    bench_exclusion(recipe)
+    bench_portion_solver(recipe)
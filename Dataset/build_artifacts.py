@@ -0,0 +1,39 @@
+import argparse
+import time
+
+from recipe_data import load_recipe_dataset, recipe_data_path
+from recipe_store import load_recipe_store, recipe_store_path
+from recommend import (
+    NUTRIENT_PATH, FeasibilityScreen, NutrientData, file_hash, ingredient_table_path, load_ingredient_table,
+)
+
+# -------------------------------------------
+# Offline build of derived dataset artifacts
+# -------------------------------------------
+# Run this before starting several uvicorn workers on changed data, so they
+# all map the same files instead of each building them at startup.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute artifacts derived from the recipe and nutrient datasets")
+    parser.add_argument('--recipes', default='cleaned_recipes.csv')
+    parser.add_argument('--nutrients', default=NUTRIENT_PATH)
+    parser.add_argument('--similarity', default='exact', choices=['exact', 'approximate'],
+                        help="ranking the prebuilt store is built for (SIMILARITY_INDEX)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    nutrients = NutrientData(args.nutrients)
+    table = load_ingredient_table(args.recipes, nutrients=nutrients)
+    FeasibilityScreen(table, nutrients)  # saves the calorie ranges next to the table
+    print(f"✅ Ingredient table and calorie ranges for {len(table)} recipes -> {ingredient_table_path(args.recipes)}/ "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    start = time.perf_counter()
+    recipe_hash = file_hash(args.recipes)
+    recipes, recipe_text = load_recipe_dataset(args.recipes, recipe_hash)
+    print(f"✅ Binary dataset for {len(recipes)} recipes -> {recipe_data_path(args.recipes)}/ "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    start = time.perf_counter()
+    store = load_recipe_store(args.recipes, recipes, recipe_text, recipe_hash, args.similarity)
+    print(f"✅ Recipe store with {len(store.partitions)} partitions -> {recipe_store_path(args.recipes)}/ "
+          f"({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,199 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from recipe_data import load_recipe_dataset, read_recipes
+from recipe_store import RecipeStore, load_recipe_store
+from recommend import NUTRIENT_PATH, FeasibilityScreen, NutrientData, file_hash, load_ingredient_table
+
+# -------------------------------------------
+# Versioned dataset snapshots
+# -------------------------------------------
+def dataset_version(recipe_hash, nutrient_hash, similarity='exact'):
+    """
+    Identifies the recipe + nutrient data (and approximate ranking, which can
+    pick different recipes); cached responses are tied to it
+    """
+    return hashlib.sha256(
+        (recipe_hash + nutrient_hash + (similarity if similarity != 'exact' else '')).encode()
+    ).hexdigest()[:16]
+
+class DatasetSnapshot:
+    """
+    Everything a request reads from the datasets, loaded together under one
+    ``version`` and never modified afterwards; a reload builds a new snapshot.
+
+    ``portion_cache`` (solutions are nutrient-table rows, so it is shared only
+    between snapshots with the same nutrient data) and ``recommend_pool``
+    (worker processes that loaded the same files) are optional.
+    """
+
+    FIELDS = ('version', 'recipe_path', 'store', 'ingredient_table', 'feasibility', 'nutrients', 'portion_cache',
+              'recommend_pool')
+
+    def __init__(self, version, recipe_path, store, ingredient_table, feasibility, nutrients, portion_cache=None,
+                 recommend_pool=None, loaded_at=None):
+        values = dict(zip(self.FIELDS, (version, recipe_path, store, ingredient_table, feasibility, nutrients,
+                                        portion_cache, recommend_pool)))
+        values['loaded_at'] = loaded_at or time.time()
+        self.__dict__.update(values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"DatasetSnapshot is immutable, use replace() to change {name!r}")
+
+    def replace(self, **changes):
+        """
+        Copy of this snapshot with some fields changed
+        """
+        values = {name: getattr(self, name) for name in self.FIELDS + ('loaded_at',)}
+        return DatasetSnapshot(**dict(values, **changes))
+
+    def close(self):
+        """
+        Release what only this snapshot uses; called once no request uses it any more
+        """
+        if self.recommend_pool is not None:
+            self.recommend_pool.shutdown()
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'recipe_path': self.recipe_path,
+            'recipes': len(self.ingredient_table),
+            'recipe_hash': self.ingredient_table.recipe_hash,
+            'nutrient_hash': self.nutrients.hash,
+            'loaded_at': self.loaded_at,
+        }
+
+def load_snapshot(recipe_path, recipe_format='binary', nutrient_path=NUTRIENT_PATH, similarity='exact',
+                  previous=None):
+    """
+    DatasetSnapshot of the files as they are now, or ``previous`` when they are unchanged.
+
+    recipe_format 'binary' reads the typed export and the prebuilt store next
+    to the CSV (both rebuilt when the CSV changes), 'csv' parses the CSV and
+    prepares the store in memory. Nutrient data that did not change is shared
+    with ``previous``, and so are the pre-screen counters.
+    """
+    recipe_hash, nutrient_hash = file_hash(recipe_path), file_hash(nutrient_path)
+    version = dataset_version(recipe_hash, nutrient_hash, similarity)
+    if previous is not None and previous.version == version:
+        return previous
+
+    nutrients = NutrientData.shared(nutrient_path, nutrient_hash)
+    if recipe_format == 'csv':
+        recipe = read_recipes(recipe_path)
+        ingredient_table = load_ingredient_table(recipe_path, recipe, nutrients)
+        store = RecipeStore(recipe, similarity=similarity)
+        store.token_index  # build the allergen index before the first request
+    else:
+        recipe, recipe_text = load_recipe_dataset(recipe_path, recipe_hash)
+        ingredient_table = load_ingredient_table(recipe_path, nutrients=nutrients)
+        store = load_recipe_store(recipe_path, recipe, recipe_text, recipe_hash, similarity)
+    if ingredient_table.recipe_hash != recipe_hash:
+        raise ValueError(f"{recipe_path} changed while it was being loaded")
+    feasibility = FeasibilityScreen(ingredient_table, nutrients)  # skips portion solves that cannot hit the target
+    if previous is not None:
+        feasibility.stats = previous.feasibility.stats
+    return DatasetSnapshot(version, recipe_path, store, ingredient_table, feasibility, nutrients)
+
+# -------------------------------------------
+# Hot reload
+# -------------------------------------------
+class DatasetManager:
+    """
+    Holds the current DatasetSnapshot and swaps in reloaded ones.
+
+    reload() runs ``load(current snapshot)`` on a background thread while
+    requests keep being served from the current snapshot, then swaps the
+    result in under a lock and calls ``on_swap(old, new)``. A request reads
+    one snapshot for its whole run, so requests already in flight finish on
+    the old version. Requests that use the snapshot's worker processes pin
+    it with use(); its close() runs once the last of them is done.
+
+    Without an initial ``snapshot`` the manager is not ready until the first
+    reload() has loaded one (``load(None)``).
+    """
+
+    def __init__(self, snapshot, load, on_swap=None):
+        self.current = snapshot
+        self.load = load
+        self.on_swap = on_swap
+        self.lock = threading.Lock()
+        self.pins = {}  # snapshot -> requests using it
+        self.loader = None
+        self.reloads = 0
+        self.last_reload = None
+
+    @property
+    def ready(self):
+        return self.current is not None
+
+    @contextmanager
+    def use(self):
+        with self.lock:
+            snapshot = self.current
+            self.pins[snapshot] = self.pins.get(snapshot, 0) + 1
+        try:
+            yield snapshot
+        finally:
+            with self.lock:
+                self.pins[snapshot] -= 1
+                retired = not self.pins[snapshot] and snapshot is not self.current
+                if not self.pins[snapshot]:
+                    del self.pins[snapshot]
+            if retired:
+                snapshot.close()
+
+    def swap(self, snapshot):
+        with self.lock:
+            previous, self.current = self.current, snapshot
+            retired = previous is not None and previous not in self.pins
+        if self.on_swap is not None:
+            self.on_swap(previous, snapshot)
+        if retired:
+            previous.close()
+
+    def reload(self):
+        """
+        Start a background reload; False if one is already running
+        """
+        with self.lock:
+            if self.reloading:
+                return False
+            self.loader = threading.Thread(target=self._reload, name='dataset-reload', daemon=True)
+            self.loader.start()
+        return True
+
+    @property
+    def reloading(self):
+        return self.loader is not None and self.loader.is_alive()
+
+    def _reload(self):
+        start = time.time()
+        previous = self.current
+        try:
+            snapshot = self.load(previous)
+        except Exception as e:
+            print("❌ Dataset load failed" + (f", still serving {previous.version}" if previous else "") + f": {e}")
+            self.last_reload = {'started_at': start, 'seconds': round(time.time() - start, 3), 'error': str(e)}
+            return
+        if snapshot is not previous:
+            self.swap(snapshot)
+            self.reloads += previous is not None
+            print(f"✅ Dataset {previous.version + ' -> ' if previous else ''}{snapshot.version} "
+                  f"({time.time() - start:.1f}s)")
+        self.last_reload = {'started_at': start, 'seconds': round(time.time() - start, 3),
+                            'version': snapshot.version, 'changed': snapshot is not previous}
+
+    def status(self):
+        with self.lock:
+            in_flight = {s.version: n for s, n in self.pins.items()}
+        return {
+            'current': self.current.describe() if self.current is not None else None,
+            'reloading': self.reloading,
+            'reloads': self.reloads,
+            'last_reload': self.last_reload,
+            'in_flight': in_flight,
+        }
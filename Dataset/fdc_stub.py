@@ -0,0 +1,133 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# -------------------------------------------
+# Local stand-in for the FoodData Central search API
+# -------------------------------------------
+# Answers GET /fdc/v1/foods/search in the shape of the real service with
+# nutrients derived from a hash of the query, so results are reproducible.
+# Failures (429 with Retry-After, or 503), latency and a short keep-alive
+# timeout can be injected to exercise nutrient_fetcher.py's retries and
+# reconnects; GET /stats reports how many searches each query received.
+SEARCH_PATH = '/fdc/v1/foods/search'
+NUTRIENTS = [  # (nutrientName, unitName, upper bound of the generated value)
+    ('Energy', 'KCAL', 900.0),
+    ('Protein', 'G', 40.0),
+    ('Total lipid (fat)', 'G', 60.0),
+    ('Carbohydrate, by difference', 'G', 90.0),
+    ('Fiber, total dietary', 'G', 15.0),
+    ('Sugars, total including NLEA', 'G', 50.0),
+    ('Sodium, Na', 'MG', 1500.0),
+]
+NO_MATCH_PREFIX = 'unknown'
+
+def search_result(query, page_size=1):
+    """
+    Search response body for ``query``; queries starting with 'unknown' find nothing
+    """
+    if query.lower().startswith(NO_MATCH_PREFIX):
+        return {'totalHits': 0, 'currentPage': 1, 'totalPages': 0, 'foods': []}
+    digest = hashlib.sha256(query.lower().encode()).digest()
+    nutrients = [
+        {'nutrientId': 1000 + i, 'nutrientName': name, 'unitName': unit,
+         'value': round(digest[i] / 255 * upper, 2)}
+        for i, (name, unit, upper) in enumerate(NUTRIENTS)
+    ]
+    food = {
+        'fdcId': int.from_bytes(digest[-4:], 'big') % 10_000_000,
+        'description': query.upper(),
+        'dataType': 'Survey (FNDDS)',
+        'publishedDate': '2024-10-31',
+        'foodNutrients': nutrients,
+    }
+    return {'totalHits': 1, 'currentPage': 1, 'totalPages': 1, 'foods': [food][:page_size]}
+
+def make_handler(fail_rate=0.0, latency=0.0, seed=0, keep_alive=None):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    counts = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        timeout = keep_alive  # idle connections are closed after this many seconds
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_html(self, status, text):
+            data = text.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            if parts.path == '/stats':
+                with lock:
+                    return self.send_json(200, dict(counts))
+            if parts.path != SEARCH_PATH:
+                return self.send_json(404, {'error': 'not found'})
+            if not params.get('api_key'):
+                return self.send_json(403, {'error': {'code': 'API_KEY_MISSING'}})
+
+            query = params.get('query', '')
+            with lock:
+                counts[query] = counts.get(query, 0) + 1
+                roll = rng.random()
+            if latency:
+                time.sleep(latency)
+            if roll < fail_rate / 3:
+                return self.send_json(429, {'error': {'code': 'OVER_RATE_LIMIT'}}, {'Retry-After': '0.2'})
+            if roll < fail_rate * 2 / 3:
+                return self.send_json(503, {'error': 'service unavailable'})
+            if roll < fail_rate:
+                return self.send_html(200, '<html><body>Gateway error</body></html>')  # a proxy's page
+            self.send_json(200, search_result(query, int(params.get('pageSize', 50))))
+
+    return Handler
+
+def serve(port, fail_rate=0.0, latency=0.0, seed=0, keep_alive=None):
+    """
+    Started stub server on 127.0.0.1:``port`` (call ``shutdown()`` to stop it)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fail_rate, latency, seed, keep_alive))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local FoodData Central search stub")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="share of searches answered with 429/503 or a non-JSON 200")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every search")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep-alive', type=float, default=None,
+                        help="close connections idle for this many seconds (exercises reconnects)")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.fail_rate, args.latency, args.seed, args.keep_alive)
+    print(f"✅ FDC stub on http://127.0.0.1:{args.port}{SEARCH_PATH}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,102 @@
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+# -------------------------------------------
+# Keep-alive HTTP/1.1 client
+# -------------------------------------------
+class Connection:
+    """
+    One persistent connection (HTTP, or HTTPS when ``tls``); reopened
+    transparently after the server closes it. A request on a reused
+    connection that fails before any response arrives (the server dropped
+    the idle connection) is sent once more on a fresh one.
+    """
+
+    def __init__(self, host, port, tls=False):
+        self.host, self.port, self.tls = host, port, tls
+        self.reader = self.writer = None
+
+    @classmethod
+    def for_url(cls, url):
+        """
+        (connection, path) for an absolute URL
+        """
+        parts = urlsplit(url)
+        tls = parts.scheme == 'https'
+        return cls(parts.hostname, parts.port or (443 if tls else 80), tls), parts.path or '/'
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def send(self, method, target, body, headers):
+        """
+        Write one request and return the response's status line (b'' if the server closed the connection)
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port, ssl=True if self.tls else None
+            )
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+        return await self.reader.readline()
+
+    async def request(self, method, target, body=b'', headers=None):
+        """
+        (status, headers, body); header names are lowercased
+        """
+        reused = self.writer is not None
+        try:
+            status_line = await self.send(method, target, body, headers)
+        except ConnectionError:
+            if not reused:
+                raise
+            status_line = b''
+        if not status_line and reused:
+            # Closed while idle, before it read the request: resend once on a fresh connection
+            await self.close()
+            status_line = await self.send(method, target, body, headers)
+        if not status_line:
+            raise ConnectionResetError("server closed the connection")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while (size := int((await self.reader.readline()).split(b';')[0], 16)) > 0:
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            await self.reader.readline()
+            data = b''.join(chunks)
+        else:
+            data = await self.reader.readexactly(int(response_headers.get('content-length', 0)))
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, data
+
+    async def post(self, path, payload):
+        """
+        (status, body) of a JSON POST
+        """
+        status, _, data = await self.request('POST', path, json.dumps(payload).encode(),
+                                             {'Content-Type': 'application/json'})
+        return status, data
+
+    async def get(self, target):
+        """
+        (status, headers, body) of a GET; ``target`` includes the query string
+        """
+        return await self.request('GET', target)
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import contextmanager
+
+import numpy as np
+
+from http_client import Connection
+from profiles import sample_profiles
+
+# -------------------------------------------
+# Load generation
+# -------------------------------------------
+def classify(status, body):
+    """
+    None for a good response, otherwise a short error label
+    """
+    if status != 200:
+        return f"HTTP {status}"
+    try:
+        message = json.loads(body).get('message', '')
+    except ValueError:
+        return "invalid JSON"
+    return "plan error" if message.startswith('Error') else None
+
+async def generate_load(url, profiles, concurrency=8, rate=None, timeout=60.0):
+    """
+    Send every profile to ``url`` over ``concurrency`` keep-alive connections.
+
+    Without ``rate`` each connection sends its next request as soon as the
+    last one finishes (closed loop). With ``rate`` requests are released on a
+    fixed schedule of ``rate`` per second (open loop); latency then counts from
+    the scheduled time, so time spent waiting for a free connection is included.
+    Returns one (latency, service time, error or None) tuple per request.
+    """
+    queue = asyncio.Queue()
+    results = []
+
+    async def worker():
+        connection, path = Connection.for_url(url)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                scheduled, profile = item
+                start = time.perf_counter()
+                try:
+                    status, body = await asyncio.wait_for(connection.post(path, profile), timeout)
+                    error = classify(status, body)
+                except asyncio.TimeoutError:
+                    error = "timeout"
+                    await connection.close()
+                except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+                    error = type(e).__name__
+                    await connection.close()
+                end = time.perf_counter()
+                results.append((end - (scheduled or start), end - start, error))
+        finally:
+            await connection.close()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for i, profile in enumerate(profiles):
+        scheduled = None
+        if rate:
+            scheduled = start + i / rate
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+        queue.put_nowait((scheduled, profile))
+    for _ in workers:
+        queue.put_nowait(None)
+    await asyncio.gather(*workers)
+    return results
+
+def report(results, seconds):
+    latency = np.array([r[0] for r in results])
+    service = np.array([r[1] for r in results])
+    errors = {}
+    for _, _, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    ms = lambda values, q: round(float(np.percentile(values, q)) * 1e3, 1) if len(values) else None
+    return {
+        'requests': len(results),
+        'seconds': round(seconds, 2),
+        'throughput': round(len(results) / seconds, 2) if seconds else 0.0,
+        'error_rate': round(sum(errors.values()) / len(results), 4) if results else 0.0,
+        'errors': errors,
+        'latency_ms': {'p50': ms(latency, 50), 'p95': ms(latency, 95), 'p99': ms(latency, 99), 'max': ms(latency, 100)},
+        'service_ms': {'p50': ms(service, 50), 'p95': ms(service, 95), 'p99': ms(service, 99)},
+    }
+
+def run_load(base_url, profiles, concurrency=8, rate=None, timeout=60.0):
+    """
+    Drive /recommend with ``profiles`` and summarize latency, throughput and errors
+    """
+    start = time.perf_counter()
+    results = asyncio.run(generate_load(base_url + "/recommend", profiles, concurrency, rate, timeout))
+    return report(results, time.perf_counter() - start)
+
+# -------------------------------------------
+# Local server
+# -------------------------------------------
+def wait_until_up(url, server, timeout=600):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"server at {url} did not start")
+
+@contextmanager
+def local_server(port, env=None):
+    """
+    uvicorn serving main:app on 127.0.0.1:``port``, stopped on exit; yields its base URL
+    """
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=dict(os.environ, **(env or {})),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url + "/health/ready", server)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent /recommend load with sampled user profiles")
+    parser.add_argument('--url', default=None, help="running server, e.g. http://127.0.0.1:8000 (default: start one)")
+    parser.add_argument('--port', type=int, default=8765, help="port of the server started when --url is not given")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8, help="keep-alive connections")
+    parser.add_argument('--rate', type=float, default=None, help="requests per second (default: as fast as possible)")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-recipe-id', type=int, default=10_000, help="range of sampled exclude_recipe_ids")
+    parser.add_argument('--output', default=None, help="also write the report as JSON")
+    args = parser.parse_args()
+
+    profiles = sample_profiles(args.requests, args.seed, args.max_recipe_id)
+    if args.url:
+        result = run_load(args.url.rstrip('/'), profiles, args.concurrency, args.rate, args.timeout)
+    else:
+        with local_server(args.port) as base_url:
+            run_load(base_url, profiles[:args.concurrency], args.concurrency)  # warm-up
+            result = run_load(base_url, profiles, args.concurrency, args.rate, args.timeout)
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
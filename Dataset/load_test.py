@@ -0,0 +1,40 @@
+import argparse
+import os
+import tempfile
+
+from load_generator import local_server, run_load
+from profiles import sample_profiles
+
+# -------------------------------------------
+# Throughput vs worker count
+# -------------------------------------------
+def measure(mode, workers, args):
+    env = dict(EXECUTION_MODE=mode, POOL_WORKERS=str(workers),
+               POOL_MAX_PENDING=str(max(args.concurrency, workers)), PORTION_CACHE_SIZE="0",
+               PORTION_CACHE_PATH=os.path.join(tempfile.gettempdir(), "load_test_portion_cache.json"))
+    # Sampled profiles are distinct, so the response cache (if enabled) does not hide the work
+    with local_server(args.port, env) as base_url:
+        run_load(base_url, sample_profiles(args.concurrency, seed=1), args.concurrency)  # warm-up
+        return run_load(base_url, sample_profiles(args.requests), args.concurrency)
+
+def describe(result):
+    latency = result['latency_ms']
+    return (f"{result['throughput']:6.2f} req/s, p50/p95/p99 {latency['p50']}/{latency['p95']}/{latency['p99']} ms, "
+            f"errors {result['error_rate'] * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /recommend throughput for each execution mode")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--requests', type=int, default=80)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.requests} requests, concurrency {args.concurrency}")
+    baseline = measure("thread", 1, args)
+    print(f"   thread mode        : {describe(baseline)}")
+    for workers in args.workers:
+        result = measure("process", workers, args)
+        print(f"   process, {workers} workers : {describe(result)} "
+              f"({result['throughput'] / baseline['throughput']:.2f}x)")
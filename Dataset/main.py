@@ -1,15 +1,156 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List, Optional
-import pandas as pd
+import asyncio
+import hmac
+import os
+import json
+import time
 
-from recommend import suggest_diet
+import numpy as np
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Any, Dict, List, Optional
 
-# Load recipe data once
-recipe = pd.read_csv("cleaned_recipes.csv")
+from dataset_snapshot import DatasetManager, load_snapshot
+from metrics import NULL_TIMER, PipelineMetrics, StageTimer
+from portion_cache import PortionCache
+from recipe_store import decode_id_bitmap
+from recommend import NUTRIENT_PATH, diet_plan_events, suggest_diet, suggest_diet_batch, warm_solver
+from response_cache import ResponseCache, normalize_profile, profile_key
+from worker_pool import PoolBusy, RecommendPool, start_solve_executor
+
+RECIPE_PATH = os.environ.get("RECIPE_PATH", "cleaned_recipes.csv")
+# "binary": typed export next to the CSV with memory-mapped text (rebuilt when the CSV changes)
+# "csv": parse the CSV directly
+RECIPE_FORMAT = os.environ.get("RECIPE_FORMAT", "binary")
+# Recipe ranking: "exact" or "approximate" (k-means cells in large partitions, see similarity_index)
+SIMILARITY_INDEX = os.environ.get("SIMILARITY_INDEX", "exact")
+
+# Portion solver: "slsqp" (reference) or "lsq" (batched least squares)
+PORTION_SOLVER = os.environ.get("PORTION_SOLVER", "slsqp")
+
+# Memoized portion solutions, shared across requests and kept across restarts
+PORTION_CACHE_PATH = os.environ.get("PORTION_CACHE_PATH", "portion_cache.json")
+
+def new_portion_cache(nutrient_hash):
+    """
+    PortionCache for the nutrient data, or None when PORTION_CACHE_SIZE is 0 (caching off)
+    """
+    maxsize = int(os.environ.get("PORTION_CACHE_SIZE", 10000))
+    if maxsize <= 0:
+        return None
+    return PortionCache(
+        maxsize=maxsize,
+        ttl=float(os.environ.get("PORTION_CACHE_TTL", 24 * 3600)),
+        bucket_kcal=float(os.environ.get("PORTION_CACHE_BUCKET", 25)),
+        version=nutrient_hash,
+    )
+
+# Where /recommend runs suggest_diet: "thread" (threadpool in this process) or
+# "process" (pre-warmed worker processes that map the same dataset files)
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "thread")
+
+def start_recommend_pool(snapshot):
+    """
+    Warmed RecommendPool whose workers loaded the same dataset version as ``snapshot``
+    """
+    pool = RecommendPool(
+        snapshot.recipe_path,
+        recipe_format=RECIPE_FORMAT,
+        workers=int(os.environ.get("POOL_WORKERS", os.cpu_count() or 1)),
+        max_pending=int(os.environ.get("POOL_MAX_PENDING", 0)) or None,
+        timeout=float(os.environ.get("POOL_TIMEOUT", 30)),
+        solver=PORTION_SOLVER,
+        portion_cache_size=int(os.environ.get("PORTION_CACHE_SIZE", 10000)),
+        similarity=SIMILARITY_INDEX,
+        nutrients=snapshot.nutrients,
+    )
+    versions = pool.warm()
+    if versions != {snapshot.version}:
+        pool.shutdown()
+        raise ValueError(f"workers loaded dataset {sorted(versions)}, expected {snapshot.version}")
+    return pool
+
+def load_dataset(previous=None):
+    """
+    Snapshot of the dataset files as they are now; ``previous`` when nothing changed.
+
+    The portion cache carries over while the nutrient data stays the same
+    (the first load reads the one saved at shutdown). In process mode the
+    snapshot's workers are started before it is swapped in, so on a reload
+    both sets of workers run until the old requests finish.
+    """
+    snapshot = load_snapshot(RECIPE_PATH, RECIPE_FORMAT, NUTRIENT_PATH, SIMILARITY_INDEX, previous)
+    if snapshot is previous:
+        return previous
+    if previous is not None and previous.nutrients is snapshot.nutrients:
+        portion_cache = previous.portion_cache
+    else:
+        portion_cache = new_portion_cache(snapshot.nutrients.hash)
+        if previous is None and portion_cache is not None:
+            print(f"🔄 Loaded {portion_cache.load(PORTION_CACHE_PATH)} cached portion solutions")
+    if previous is None:
+        warm_solver(PORTION_SOLVER)  # before /health/ready turns 200
+    recommend_pool = start_recommend_pool(snapshot) if EXECUTION_MODE == "process" else None
+    return snapshot.replace(portion_cache=portion_cache, recommend_pool=recommend_pool)
+
+def dataset_swapped(previous, snapshot):
+    if response_cache is not None:
+        response_cache.set_version(snapshot.version)
+
+# The datasets are loaded in the background once the server is up (see
+# /health/ready); POST /admin/reload swaps in a fresh snapshot without a restart
+datasets = DatasetManager(None, load_dataset, on_swap=dataset_swapped)
+
+# Opt-in /recommend response cache: RESPONSE_CACHE_SIZE > 0 enables it,
+# RESPONSE_CACHE_DIR adds a file-backed tier shared across restarts
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 0))
+response_cache = ResponseCache(
+    maxsize=RESPONSE_CACHE_SIZE,
+    directory=os.environ.get("RESPONSE_CACHE_DIR") or None,
+) if RESPONSE_CACHE_SIZE > 0 else None
+
+# Admin endpoints: with ADMIN_TOKEN set they need a matching X-Admin-Token
+# header, without it they only answer requests from this machine
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Speculative candidate evaluation (thread mode): SPECULATIVE_CANDIDATES > 1
+# solves that many ranked candidates concurrently on SPECULATIVE_WORKERS
+# processes (SPECULATIVE_EXECUTOR=thread for threads); meals are still
+# accepted in rank order, so plans do not change
+SPECULATIVE_CANDIDATES = int(os.environ.get("SPECULATIVE_CANDIDATES", 0))
+solve_executor = None
+
+# Stage timers and counters for /recommend, served on /metrics with a
+# Server-Timing header per response; METRICS_ENABLED=0 turns them off
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+pipeline_metrics = PipelineMetrics()
 
 app = FastAPI()
 
+@app.on_event("startup")
+def start_workers():
+    global solve_executor
+    if SPECULATIVE_CANDIDATES > 1 and EXECUTION_MODE != "process":
+        solve_executor = start_solve_executor(
+            os.environ.get("SPECULATIVE_EXECUTOR", "process"),
+            workers=int(os.environ.get("SPECULATIVE_WORKERS", os.cpu_count() or 1)),
+        )
+    datasets.reload()  # after forking the solve workers, which do not need the recipe data
+
+@app.on_event("shutdown")
+def save_portion_cache():
+    snapshot = datasets.current
+    if snapshot is not None:
+        if snapshot.portion_cache is not None:
+            try:
+                snapshot.portion_cache.save(PORTION_CACHE_PATH)
+            except OSError as e:
+                print(f"❌ Could not save portion cache {PORTION_CACHE_PATH}: {e}")
+        snapshot.close()
+    if solve_executor is not None:
+        solve_executor.shutdown(wait=False, cancel_futures=True)
+
 class UserInput(BaseModel):
     gender: int  # 0 female, 1 male
     age: int
@@ -21,23 +162,317 @@ class UserInput(BaseModel):
     health_conditions: List[str]
     activity_type: str
     exclude_recipe_names: Optional[List[str]] = []  # optional to exclude recipes
+    allergies: Optional[List[str]] = []  # used with the "allergy" health condition
+    exclude_recipe_ids: Optional[List[int]] = []  # RecipeId values from earlier plans
+    exclude_recipe_bitmap: Optional[str] = None  # same, as an encode_id_bitmap() string
 
-@app.post("/recommend")
-def get_diet_plan(user_input: UserInput):
-    input_data = user_input.dict()
+class BatchInput(BaseModel):
+    users: List[Dict[str, Any]]  # each item is validated as a UserInput on its own
+    stream: bool = False  # NDJSON, one line per user as plans finish
+
+def wrap_plan(plan):
+    # Always return a consistent structure
+    # If plan is None or doesn't have 'diet_plan', return empty meals
+    if not plan or not plan.get("diet_plan"):
+        return {"diet_plan": {"meals": []}, "message": "No suitable diet plan found."}
+    # If plan['diet_plan'] is a list (old style), wrap it
+    if isinstance(plan["diet_plan"], list):
+        plan["diet_plan"] = {"meals": plan["diet_plan"]}
+    # If meals is missing or not a list, set to []
+    if "meals" not in plan["diet_plan"] or not isinstance(plan["diet_plan"]["meals"], list):
+        plan["diet_plan"]["meals"] = []
+    return plan
+
+def not_ready():
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"},
+                        content={"diet_plan": {"meals": []}, "message": "Dataset is still loading, try again later."})
+
+def merge_exclusion_bitmap(input_data: dict, store):
+    """
+    Fold exclude_recipe_bitmap into exclude_recipe_ids (as an int64 array);
+    raises ValueError if malformed or longer than the ids of ``store``
+    """
+    bitmap = input_data.pop("exclude_recipe_bitmap", None)
+    if bitmap:
+        input_data["exclude_recipe_ids"] = np.concatenate([
+            np.asarray(input_data.get("exclude_recipe_ids") or [], dtype=np.int64),
+            decode_id_bitmap(bitmap, store.max_id + 1),
+        ])
+    return input_data
+
+def build_diet_plan(input_data: dict, timer=NULL_TIMER, snapshot=None):
+    snapshot = snapshot or datasets.current
     exclude_list = input_data.pop("exclude_recipe_names", [])
+    exclude_ids = input_data.pop("exclude_recipe_ids", [])
     try:
-        plan = suggest_diet(input_data, recipe, exclude_recipe_names=exclude_list)
-        # Always return a consistent structure
-        # If plan is None or doesn't have 'diet_plan', return empty meals
-        if not plan or not plan.get("diet_plan"):
-            return {"diet_plan": {"meals": []}, "message": "No suitable diet plan found."}
-        # If plan['diet_plan'] is a list (old style), wrap it
-        if isinstance(plan["diet_plan"], list):
-            plan["diet_plan"] = {"meals": plan["diet_plan"]}
-        # If meals is missing or not a list, set to []
-        if "meals" not in plan["diet_plan"] or not isinstance(plan["diet_plan"]["meals"], list):
-            plan["diet_plan"]["meals"] = []
-        return plan
+        plan = suggest_diet(input_data, snapshot.store, exclude_recipe_names=exclude_list, exclude_recipe_ids=exclude_ids,
+                            ingredient_table=snapshot.ingredient_table, feasibility=snapshot.feasibility,
+                            solver=PORTION_SOLVER, portion_cache=snapshot.portion_cache, timer=timer,
+                            executor=solve_executor, speculate=SPECULATIVE_CANDIDATES, nutrients=snapshot.nutrients)
+        return wrap_plan(plan)
     except Exception as e:
         return {"diet_plan": {"meals": []}, "message": f"Error: {str(e)}"}
+
+async def compute_diet_plan(input_data: dict, snapshot, response: Response = None):
+    """
+    build_diet_plan() on ``snapshot``, off the event loop; raises PoolBusy or asyncio.TimeoutError in process mode.
+    With metrics enabled the request is recorded and ``response`` gets a Server-Timing header.
+    """
+    start = time.perf_counter()
+    timer = StageTimer() if METRICS_ENABLED else NULL_TIMER
+    if snapshot.recommend_pool is None:
+        plan = await run_in_threadpool(build_diet_plan, input_data, timer, snapshot)
+    else:
+        exclude_list = input_data.pop("exclude_recipe_names", [])
+        exclude_ids = input_data.pop("exclude_recipe_ids", [])
+        try:
+            plan, worker_timer = await snapshot.recommend_pool.suggest_diet(
+                input_data, exclude_list, exclude_ids, timer.enabled
+            )
+            plan = wrap_plan(plan)
+        except (PoolBusy, asyncio.TimeoutError):
+            raise
+        except Exception as e:
+            return {"diet_plan": {"meals": []}, "message": f"Error: {str(e)}"}
+        timer = worker_timer or timer
+
+    if timer.enabled:
+        elapsed = time.perf_counter() - start
+        pipeline_metrics.record(timer, elapsed)
+        if response is not None:
+            response.headers["Server-Timing"] = timer.server_timing(elapsed)
+    return plan
+
+@app.post("/recommend")
+async def get_diet_plan(user_input: UserInput, response: Response):
+    """
+    The plan is computed on the dataset snapshot current when the request
+    arrives, whose version is returned as "dataset_version" and in the
+    X-Dataset-Version header (cached responses keep the version they were computed on)
+    """
+    if not datasets.ready:
+        return not_ready()
+    input_data = user_input.dict()
+    with datasets.use() as snapshot:
+        version = snapshot.version
+        response.headers["X-Dataset-Version"] = version
+        try:
+            merge_exclusion_bitmap(input_data, snapshot.store)
+        except ValueError as e:
+            return {"diet_plan": {"meals": []}, "message": f"Error: {str(e)}", "dataset_version": version}
+        try:
+            if response_cache is None:
+                return dict(await compute_diet_plan(input_data, snapshot, response), dataset_version=version)
+
+            # Equivalent profiles share one entry, so the plan is computed from the normalized profile
+            profile = normalize_profile(input_data)
+            key = profile_key(profile)
+            plan = response_cache.get(key)
+            if plan is not None:
+                response.headers["X-Cache"] = "HIT"
+                response.headers["X-Dataset-Version"] = plan.setdefault("dataset_version", response_cache.version)
+                return plan
+
+            plan = dict(await compute_diet_plan(profile, snapshot, response), dataset_version=version)
+            if not plan.get("message", "").startswith("Error"):
+                response_cache.put(key, plan, version)
+            response.headers["X-Cache"] = "MISS"
+            return plan
+        except PoolBusy:
+            return JSONResponse(status_code=503, headers={"X-Dataset-Version": version}, content={
+                "diet_plan": {"meals": []}, "message": "Server busy, try again later.", "dataset_version": version,
+            })
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code=504, headers={"X-Dataset-Version": version}, content={
+                "diet_plan": {"meals": []}, "message": "Recommendation timed out.", "dataset_version": version,
+            })
+
+def format_event(event: str, data: dict, media: str):
+    if media == "ndjson":
+        return json.dumps({"event": event, "data": data}) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def plan_events(input_data: dict, media: str, snapshot):
+    """
+    Formatted diet_plan_events() on ``snapshot``: the plan header (with the
+    dataset_version), each meal as it is accepted, then a summary with the
+    meal count (and a message when there are none); failures end the stream
+    with an "error" event
+    """
+    start = time.perf_counter()
+    timer = StageTimer() if METRICS_ENABLED else NULL_TIMER
+    meals = 0
+    try:
+        merge_exclusion_bitmap(input_data, snapshot.store)
+        exclude_list = input_data.pop("exclude_recipe_names", [])
+        exclude_ids = input_data.pop("exclude_recipe_ids", [])
+        for event, data in diet_plan_events(
+            input_data, snapshot.store, exclude_recipe_names=exclude_list, exclude_recipe_ids=exclude_ids,
+            ingredient_table=snapshot.ingredient_table, feasibility=snapshot.feasibility, solver=PORTION_SOLVER,
+            portion_cache=snapshot.portion_cache, timer=timer, executor=solve_executor,
+            speculate=SPECULATIVE_CANDIDATES, nutrients=snapshot.nutrients,
+        ):
+            if event == "plan":
+                data = dict(data, dataset_version=snapshot.version)
+            elif event == "meal":
+                meals += 1
+            elif event == "summary":
+                data = dict(data, meals=meals)
+                if not meals:
+                    data["message"] = "No suitable diet plan found."
+            yield format_event(event, data, media)
+    except Exception as e:
+        yield format_event("error", {"message": f"Error: {str(e)}"}, media)
+        return
+    if timer.enabled:
+        pipeline_metrics.record(timer, time.perf_counter() - start)
+
+def pinned(make_items):
+    """
+    Generator that pins the current dataset snapshot and yields it first, then
+    the items of ``make_items(snapshot)``; the pin is released once the
+    generator is exhausted or closed, so a hot-reload cannot close the
+    snapshot under a response that is still being streamed
+    """
+    with datasets.use() as snapshot:
+        yield snapshot
+        yield from make_items(snapshot)
+
+@app.post("/recommend/stream")
+def stream_diet_plan(user_input: UserInput, format: str = Query("sse", pattern="^(sse|ndjson)$")):
+    """
+    /recommend as a stream of events, Server-Sent Events by default or NDJSON
+    with ?format=ndjson. Always computed in this process, whatever EXECUTION_MODE.
+    """
+    if not datasets.ready:
+        return not_ready()
+    events = pinned(lambda snapshot: plan_events(user_input.dict(), format, snapshot))
+    snapshot = next(events)
+    if format == "ndjson":
+        return StreamingResponse(events, media_type="application/x-ndjson",
+                                 headers={"X-Dataset-Version": snapshot.version})
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                                      "X-Dataset-Version": snapshot.version})
+
+def batch_results(users: List[Dict[str, Any]], snapshot):
+    """
+    One {"index", "plan"} or {"index", "error"} item per user, in completion order
+    """
+    valid, inputs, excludes, exclude_ids = [], [], [], []
+    for i, item in enumerate(users):
+        try:
+            input_data = merge_exclusion_bitmap(UserInput(**item).dict(), snapshot.store)
+        except (ValidationError, ValueError) as e:
+            yield {"index": i, "error": str(e)}
+            continue
+        excludes.append(input_data.pop("exclude_recipe_names", []))
+        exclude_ids.append(input_data.pop("exclude_recipe_ids", []))
+        valid.append(i)
+        inputs.append(input_data)
+
+    for j, plan, error in suggest_diet_batch(inputs, snapshot.store, excludes, exclude_ids,
+                                             ingredient_table=snapshot.ingredient_table, feasibility=snapshot.feasibility,
+                                             solver=PORTION_SOLVER, portion_cache=snapshot.portion_cache,
+                                             nutrients=snapshot.nutrients):
+        if error is not None:
+            yield {"index": valid[j], "error": error}
+        else:
+            yield {"index": valid[j], "plan": wrap_plan(plan)}
+
+@app.post("/recommend/batch")
+def get_diet_plans(batch: BatchInput, response: Response):
+    if not datasets.ready:
+        return not_ready()
+    if batch.stream:
+        lines = pinned(lambda snapshot: (json.dumps(item) + "\n" for item in batch_results(batch.users, snapshot)))
+        snapshot = next(lines)
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers={"X-Dataset-Version": snapshot.version})
+
+    with datasets.use() as snapshot:
+        results = sorted(batch_results(batch.users, snapshot), key=lambda item: item["index"])
+    response.headers["X-Dataset-Version"] = snapshot.version
+    return {"results": results, "errors": sum("error" in item for item in results), "dataset_version": snapshot.version}
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    portion_cache = datasets.current.portion_cache if datasets.ready else None
+    return {
+        "portion_cache": portion_cache.stats() if portion_cache is not None else None,
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+    }
+
+@app.get("/stats")
+def get_stats():
+    """
+    Pipeline counters; in process mode these cover this process only
+    """
+    return {"prescreen": datasets.current.feasibility.stats.snapshot() if datasets.ready else None}
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Prometheus metrics for /recommend; in process mode the cache and pre-screen
+    gauges cover this process only
+    """
+    if not METRICS_ENABLED:
+        return Response(status_code=404)
+    gauges = {}
+    if datasets.ready:
+        prescreen = datasets.current.feasibility.stats.snapshot()
+        gauges["prescreen_rejected"] = ("Candidates skipped by the feasibility pre-screen", prescreen["rejected"])
+    if datasets.ready and datasets.current.portion_cache is not None:
+        portion = datasets.current.portion_cache.stats()
+        gauges["portion_cache_hits"] = ("Portion cache hits", portion["hits"])
+        gauges["portion_cache_misses"] = ("Portion cache misses", portion["misses"])
+        gauges["portion_cache_rejected_hits"] = ("Portion cache hits on rejected recipes", portion["rejected_hits"])
+        gauges["portion_cache_stale"] = ("Portion cache entries solved again for another target", portion["stale"])
+    if response_cache is not None:
+        responses = response_cache.stats()
+        gauges["response_cache_hits"] = ("Response cache hits", responses["hits"])
+        gauges["response_cache_misses"] = ("Response cache misses", responses["misses"])
+    return Response(pipeline_metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/live")
+async def liveness():
+    """
+    The process is up and its event loop answers; says nothing about the dataset
+    """
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """
+    200 once a dataset snapshot is loaded (and, in process mode, its workers
+    are up), 503 until then; route traffic only to ready instances
+    """
+    if datasets.ready:
+        return {"status": "ready", "dataset_version": datasets.current.version}
+    last = datasets.last_reload
+    if not datasets.reloading and last is not None and "error" in last:
+        return JSONResponse(status_code=503, content={"status": "failed", "error": last["error"]})
+    return JSONResponse(status_code=503, headers={"Retry-After": "1"}, content={"status": "loading"})
+
+def admin_allowed(request: Request):
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+    return request.client is not None and request.client.host in ("127.0.0.1", "::1")
+
+@app.post("/admin/reload")
+def reload_dataset(request: Request):
+    """
+    Reload the dataset files in the background (202), or 409 while a reload
+    is already running; GET /admin/dataset shows when the new version is live
+    """
+    if not admin_allowed(request):
+        return JSONResponse(status_code=403, content={"message": "Forbidden"})
+    started = datasets.reload()
+    return JSONResponse(status_code=202 if started else 409,
+                        content={"reloading": True, "started": started,
+                                 "version": datasets.current.version if datasets.ready else None})
+
+@app.get("/admin/dataset")
+def get_dataset_status(request: Request):
+    if not admin_allowed(request):
+        return JSONResponse(status_code=403, content={"message": "Forbidden"})
+    return datasets.status()
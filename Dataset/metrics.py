@@ -0,0 +1,167 @@
+import threading
+import time
+
+# -------------------------------------------
+# Pipeline instrumentation
+# -------------------------------------------
+# Stages of suggest_diet, in pipeline order
+STAGES = ('filter', 'rank', 'extract', 'solve', 'inject')
+COUNTERS = {
+    'candidates_examined': "Ranked candidates considered, including those skipped by the pre-screen",
+    'solves_attempted': "Portion solves run (portion cache hits excluded)",
+    'solves_failed': "SLSQP portion solves that failed and used a fallback",
+    'meals_accepted': "Meals added to a diet plan",
+}
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StageTimer:
+    """
+    Stage durations and counters of one suggest_diet call.
+
+    Holds plain dicts only, so a timer filled in a worker process can be
+    returned to the API process and recorded there.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.seconds = {}
+        self.counts = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def server_timing(self, total_seconds=None):
+        """
+        Server-Timing header value, durations in milliseconds
+        """
+        parts = [f"{name};dur={self.seconds[name] * 1e3:.2f}" for name in STAGES if name in self.seconds]
+        if total_seconds is not None:
+            parts.append(f"total;dur={total_seconds * 1e3:.2f}")
+        return ", ".join(parts)
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+class NullTimer:
+    """
+    Disabled instrumentation: every call is a no-op
+    """
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+# -------------------------------------------
+# Process-wide aggregation
+# -------------------------------------------
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # non-cumulative, one per bucket
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def render(self, name, labels=''):
+        lines, cumulative = [], 0
+        sep = ',' if labels else ''
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum:.6f}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+class PipelineMetrics:
+    """
+    Histograms of per-request stage time and totals of the pipeline counters,
+    in Prometheus text exposition format
+    """
+
+    def __init__(self, prefix='diet'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.stages = {name: Histogram() for name in STAGES}
+        self.requests = Histogram()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def record(self, timer, total_seconds):
+        """
+        Add one finished request
+        """
+        if not timer.enabled:
+            return
+        with self.lock:
+            for name, seconds in timer.seconds.items():
+                self.stages[name].observe(seconds)
+            for name, n in timer.counts.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            self.requests.observe(total_seconds)
+
+    def render(self, gauges=None):
+        """
+        Metrics page; ``gauges`` adds {name: (help, value)} read at scrape time
+        """
+        p = self.prefix
+        with self.lock:
+            lines = [f'# HELP {p}_request_seconds Time spent computing a diet plan',
+                     f'# TYPE {p}_request_seconds histogram']
+            lines += self.requests.render(f'{p}_request_seconds')
+            lines += [f'# HELP {p}_stage_seconds Time per suggest_diet stage in one request',
+                      f'# TYPE {p}_stage_seconds histogram']
+            for name, histogram in self.stages.items():
+                lines += histogram.render(f'{p}_stage_seconds', f'stage="{name}"')
+            for name, value in self.counters.items():
+                lines += [f'# HELP {p}_{name}_total {COUNTERS.get(name, name)}',
+                          f'# TYPE {p}_{name}_total counter',
+                          f'{p}_{name}_total {value}']
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f'# HELP {p}_{name} {help_text}', f'# TYPE {p}_{name} gauge', f'{p}_{name} {value}']
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import random
+import time
+from urllib.parse import urlencode
+
+import pandas as pd
+
+from http_client import Connection
+
+# -------------------------------------------
+# Nutrient lookup fetcher (FoodData Central search)
+# -------------------------------------------
+# Replaces the one-request-per-second crawler that rebuilt nutrient_lookup.csv
+# from scratch. Searches go out over a few keep-alive connections behind a
+# shared token bucket, failed searches are retried with backoff, and every
+# result is appended to a JSONL checkpoint as soon as it arrives. A rerun
+# (after an interrupt, or with a longer food list) only searches foods that
+# are missing from the checkpoint, whose query changed, or whose entry is
+# older than --max-age.
+FDC_SEARCH_URL = "https://api.nal.usda.gov/fdc/v1/foods/search"
+FIELDNAMES = ['food', 'calories', 'protein', 'fat', 'carbs', 'fiber', 'sugar', 'sodium']
+NUTRIENT_NAMES = {
+    'calories': ('Energy', 'Energy (kcal)'),
+    'protein': ('Protein',),
+    'fat': ('Total lipid (fat)',),
+    'carbs': ('Carbohydrate, by difference',),
+    'fiber': ('Fiber, total dietary',),
+    'sugar': ('Sugars, total including NLEA',),
+    'sodium': ('Sodium, Na',),
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class FetchError(Exception):
+    pass
+
+def parse_search(food, data):
+    """
+    nutrient_lookup.csv row for the top search hit, or None when nothing matched
+    """
+    if not data.get('foods'):
+        return None
+    nutrients = {n['nutrientName']: n.get('value') for n in data['foods'][0].get('foodNutrients', [])}
+    row = {'food': food}
+    for field, names in NUTRIENT_NAMES.items():
+        row[field] = next((nutrients[n] for n in names if nutrients.get(n) is not None), None)
+    return row
+
+def query_params(food, page_size=1):
+    """
+    Search parameters apart from the API key; their hash tells whether a checkpointed result is still current
+    """
+    return {'query': food, 'pageSize': page_size}
+
+def query_hash(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+# -------------------------------------------
+# Rate limiting
+# -------------------------------------------
+class TokenBucket:
+    """
+    Allows ``rate`` acquisitions per second on average and bursts of up to ``capacity``
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """
+        Hold back every caller for ``seconds`` (server asked us to slow down)
+        """
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+# -------------------------------------------
+# Checkpoint
+# -------------------------------------------
+def load_checkpoint(path):
+    """
+    {food: entry} from the JSONL checkpoint; later lines win and a torn last line is ignored
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries[entry['food']] = entry
+    return entries
+
+def compact_checkpoint(path, entries):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for entry in entries.values():
+            f.write(json.dumps(entry) + '\n')
+    os.replace(tmp_path, path)
+
+def is_stale(entry, params, max_age=None, now=None):
+    if entry is None or entry.get('query') != query_hash(params):
+        return True
+    return max_age is not None and (now or time.time()) - entry['fetched_at'] > max_age
+
+def write_lookup(path, foods, entries):
+    """
+    Atomically write the rows of ``foods`` (in that order) that have data; returns the row count
+    """
+    rows = [entries[f]['row'] for f in foods if f in entries and entries[f]['row'] is not None]
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+# -------------------------------------------
+# Fetching
+# -------------------------------------------
+async def search(connection, path, params, api_key, bucket, retries=5, backoff=0.5, timeout=30.0):
+    """
+    Parsed JSON of one search, retrying 429/5xx, invalid JSON, timeouts and dropped connections with exponential backoff
+    """
+    target = path + '?' + urlencode(dict(params, api_key=api_key))
+    for attempt in range(retries + 1):
+        await bucket.acquire()
+        delay = backoff * 2 ** attempt * (0.5 + random.random())
+        try:
+            status, headers, body = await asyncio.wait_for(connection.get(target), timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            await connection.close()
+            error = type(e).__name__
+        else:
+            if status == 200:
+                try:
+                    return json.loads(body)
+                except ValueError:  # truncated body or a proxy's error page
+                    await connection.close()
+                    error = "invalid JSON"
+            elif status not in RETRY_STATUSES:
+                raise FetchError(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+            else:
+                error = f"HTTP {status}"
+                if 'retry-after' in headers:
+                    try:
+                        delay = max(delay, float(headers['retry-after']))
+                    except ValueError:
+                        pass
+                    bucket.pause(delay)
+        if attempt < retries:
+            await asyncio.sleep(delay)
+    raise FetchError(f"{error} after {retries + 1} attempts")
+
+async def fetch_foods(foods, checkpoint_path, api_key, base_url=FDC_SEARCH_URL, concurrency=4,
+                      rate=1.0, retries=5, backoff=0.5, timeout=30.0):
+    """
+    Search every food in ``foods`` and append each result to the checkpoint.
+
+    ``concurrency`` workers each hold one keep-alive connection and share a
+    token bucket of ``rate`` searches per second. Returns {food: error} for
+    the foods that still failed after all retries; they are left out of the
+    checkpoint so the next run tries them again.
+    """
+    queue = asyncio.Queue()
+    for food in foods:
+        queue.put_nowait(food)
+    bucket = TokenBucket(rate)
+    failures = {}
+    done = 0
+
+    with open(checkpoint_path, 'a') as checkpoint:
+        async def worker():
+            nonlocal done
+            connection, path = Connection.for_url(base_url)
+            try:
+                while not queue.empty():
+                    food = queue.get_nowait()
+                    params = query_params(food)
+                    try:
+                        data = await search(connection, path, params, api_key, bucket, retries, backoff, timeout)
+                    except FetchError as e:
+                        failures[food] = str(e)
+                        print(f"❌ {food}: {e}")
+                        continue
+                    row = parse_search(food, data)
+                    if row is None:
+                        print(f"No data found for {food}")
+                    entry = {'food': food, 'query': query_hash(params), 'row': row, 'fetched_at': time.time()}
+                    checkpoint.write(json.dumps(entry) + '\n')
+                    checkpoint.flush()
+                    done += 1
+                    if done % 50 == 0:
+                        print(f"🔄 {done}/{len(foods)} foods fetched")
+            finally:
+                await connection.close()
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(foods))))))
+    return failures
+
+def update_lookup(foods, output_path, api_key, checkpoint_path=None, max_age=None, refresh=False, **fetch_options):
+    """
+    Bring ``output_path`` up to date for ``foods``, fetching only what the checkpoint lacks.
+
+    Returns (foods searched, foods that failed).
+    """
+    checkpoint_path = checkpoint_path or output_path + '.checkpoint.jsonl'
+    foods = list(dict.fromkeys(foods))
+    entries = load_checkpoint(checkpoint_path)
+    now = time.time()
+    pending = [f for f in foods if refresh or is_stale(entries.get(f), query_params(f), max_age, now)]
+    print(f"🔄 {len(pending)} of {len(foods)} foods to fetch ({len(foods) - len(pending)} current in checkpoint)")
+
+    failures = {}
+    if pending:
+        compact_checkpoint(checkpoint_path, entries)  # drops a torn last line before appending
+        failures = asyncio.run(fetch_foods(pending, checkpoint_path, api_key, **fetch_options))
+        entries = load_checkpoint(checkpoint_path)
+        compact_checkpoint(checkpoint_path, entries)
+    rows = write_lookup(output_path, foods, entries)
+    print(f"✅ {rows} foods -> {output_path}" + (f" ({len(failures)} failed, rerun to retry)" if failures else ""))
+    return pending, failures
+
+def read_foods(path):
+    """
+    Food names from a CSV with a 'food' column, or from a text file with one per line
+    """
+    if path.endswith('.csv'):
+        return pd.read_csv(path)['food'].dropna().astype(str).tolist()
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch per-100g nutrients for a food list from FoodData Central")
+    parser.add_argument('--foods', default='nutrient_cleaned.csv',
+                        help="CSV with a 'food' column or a text file with one food per line")
+    parser.add_argument('--output', default='nutrient_lookup.csv')
+    parser.add_argument('--checkpoint', default=None, help="default: <output>.checkpoint.jsonl")
+    parser.add_argument('--base-url', default=FDC_SEARCH_URL, help="search endpoint (e.g. a local fdc_stub.py)")
+    parser.add_argument('--concurrency', type=int, default=4, help="parallel keep-alive connections")
+    parser.add_argument('--rate', type=float, default=1.0, help="searches per second across all connections")
+    parser.add_argument('--retries', type=int, default=5)
+    parser.add_argument('--backoff', type=float, default=0.5, help="first retry delay in seconds, doubled each attempt")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--max-age', type=float, default=None, help="refetch entries older than this many days")
+    parser.add_argument('--refresh', action='store_true', help="refetch every food")
+    args = parser.parse_args()
+
+    api_key = os.environ.get('FDC_API_KEY')
+    if not api_key:
+        parser.error("set FDC_API_KEY to a FoodData Central API key")
+    _, failures = update_lookup(
+        read_foods(args.foods), args.output, api_key, args.checkpoint,
+        max_age=args.max_age * 86400 if args.max_age is not None else None, refresh=args.refresh,
+        base_url=args.base_url, concurrency=args.concurrency, rate=args.rate, retries=args.retries,
+        backoff=args.backoff, timeout=args.timeout,
+    )
+    if failures:
+        raise SystemExit(1)
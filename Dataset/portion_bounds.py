@@ -0,0 +1,129 @@
+import numpy as np
+
+# -------------------------------------------
+# Food -> portion bounds resolver
+# -------------------------------------------
+def portion_scale(target_calories):
+    """
+    Meal-size scale factor for portion bounds: 0.8 below 300 kcal, 1.2 above 600
+    """
+    target_calories = np.asarray(target_calories, dtype=np.float64)
+    return np.where(target_calories < 300, 0.8, np.where(target_calories > 600, 1.2, 1.0))
+
+def match_guideline(food, keys):
+    """
+    Guideline keys that best match a food name, by deterministic longest match.
+
+    The longest keys contained in the name win; if no key is contained in the
+    name, the shortest keys that contain the name are used. Returns every key
+    tied for best (sorted), or an empty list if nothing matches.
+    """
+    contained = [k for k in keys if k in food]
+    if contained:
+        best = max(len(k) for k in contained)
+        return sorted(k for k in contained if len(k) == best)
+    containing = [k for k in keys if food in k]
+    if containing:
+        best = min(len(k) for k in containing)
+        return sorted(k for k in containing if len(k) == best)
+    return []
+
+class PortionBounds:
+    """
+    Base (min, max) portion grams for every food, as arrays aligned with the
+    nutrient table rows.
+
+    Foods are resolved once with match_guideline(), so the result does not
+    depend on the order of the guideline dict. When several keys tie for the
+    best match, the one occurring last in the food name is used (the head noun
+    in names like "chicken broth"), then the alphabetically first; foods whose
+    tied keys disagree on bounds are listed in ``ambiguous``.
+    """
+
+    def __init__(self, foods, guidelines):
+        self.guidelines = dict(guidelines)
+        self.default = self.guidelines.pop('default', (50, 150))
+        self.keys = sorted(self.guidelines)
+        self.foods = list(foods)
+        self.matched = []
+        self.ambiguous = []
+        self.min_g = np.empty(len(self.foods), dtype=np.int64)
+        self.max_g = np.empty(len(self.foods), dtype=np.int64)
+        for i, food in enumerate(self.foods):
+            key, ties = self.match(food)
+            self.matched.append(key)
+            if len({self.guidelines[k] for k in ties}) > 1:
+                self.ambiguous.append((food, ties))
+            self.min_g[i], self.max_g[i] = self.guidelines[key] if key else self.default
+        self.extra = {}  # bounds of names outside the nutrient table, resolved on demand
+
+    def match(self, food):
+        """
+        (chosen key or None, all keys tied for the best match)
+        """
+        food = food.lower()
+        ties = match_guideline(food, self.keys)
+        if not ties:
+            return None, ties
+        return max(ties, key=food.rfind), ties
+
+    def base(self, food):
+        """
+        Unscaled (min, max) grams for any food name
+        """
+        bounds = self.extra.get(food)
+        if bounds is None:
+            key, _ = self.match(food)
+            bounds = self.extra[food] = self.guidelines[key] if key else self.default
+        return bounds
+
+    def scaled(self, rows, target_calories):
+        """
+        (min, max) whole grams for nutrient rows at a meal's calorie target
+        """
+        scale = portion_scale(target_calories)
+        return (self.min_g[rows] * scale).astype(np.int64), (self.max_g[rows] * scale).astype(np.int64)
+
+
+def legacy_portion_match(food, guidelines):
+    """
+    First key in dict order with ``key in food or food in key`` (the old scan)
+    """
+    for key in guidelines:
+        if key in food or food in key:
+            return key
+    return None
+
+def check_portion_bounds(bounds, guidelines):
+    """
+    Assert the resolved table is complete, consistent and order-independent;
+    report ambiguous matches and foods that resolve differently than the old scan
+    """
+    assert len(bounds.min_g) == len(bounds.foods) == len(bounds.max_g)
+    assert (bounds.min_g > 0).all() and (bounds.min_g <= bounds.max_g).all(), "invalid bounds"
+
+    for food, key in zip(bounds.foods, bounds.matched):
+        if key is not None:
+            assert key in food or food in key, f"{food!r} matched unrelated key {key!r}"
+            longer = [k for k in bounds.keys if k in food and len(k) > len(key)]
+            assert not longer, f"{food!r} matched {key!r} but {longer} are longer"
+
+    reordered = PortionBounds(bounds.foods, dict(reversed(list(guidelines.items()))))
+    assert (reordered.min_g == bounds.min_g).all() and (reordered.max_g == bounds.max_g).all(), \
+        "resolution depends on guideline order"
+
+    print(f"✅ {len(bounds.foods)} foods resolved, "
+          f"{sum(k is None for k in bounds.matched)} use the default bounds")
+    for food, ties in bounds.ambiguous:
+        chosen = bounds.matched[bounds.foods.index(food)]
+        print(f"⚠️  ambiguous: {food!r} matches {ties} with different bounds, using {chosen!r}")
+    for food, key, lo, hi in zip(bounds.foods, bounds.matched, bounds.min_g, bounds.max_g):
+        old = legacy_portion_match(food, guidelines)
+        old_bounds = guidelines[old] if old else guidelines.get('default', (50, 150))
+        if tuple(old_bounds) != (lo, hi):
+            print(f"   changed: {food!r} {old!r} {tuple(old_bounds)} -> {key!r} ({lo}, {hi})")
+
+
+if __name__ == "__main__":
+    from recommend import portion_bounds, portion_guidelines
+    check_portion_bounds(portion_bounds, portion_guidelines)
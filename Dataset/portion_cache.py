@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# -------------------------------------------
+# Portion optimization memo cache
+# -------------------------------------------
+# What get() returns for a rejected entry: no portions, which the caller rejects again
+REJECTED = (np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float64))
+
+class PortionCache:
+    """
+    Bounded LRU cache of portion solutions with a TTL.
+
+    Keys are (solver, sorted ingredient names, calorie bucket); targets within
+    the same ``bucket_kcal`` wide bucket share one entry. The bucket is only
+    the lookup key: callers solve at the actual target and pass ``accept`` to
+    get() so that an entry solved for a nearby target is only used when it
+    also fits this one. Values are (rows, grams) arrays, or REJECTED for a
+    recipe whose solve gave no acceptable portions (reject()), so that it is
+    skipped instead of solved again.
+    """
+
+    def __init__(self, maxsize=10000, ttl=24 * 3600, bucket_kcal=25, version=''):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.bucket_kcal = bucket_kcal
+        self.version = version  # e.g. nutrient data hash; persisted entries from other versions are dropped
+        self.entries = OrderedDict()  # key -> (stored_at, rows, grams); rows and grams are None once rejected
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        self.rejected_hits = self.stale = 0  # hits on rejected entries; misses on entries accept() refused
+
+    def key(self, ingredients, target_calories, solver='slsqp'):
+        return (solver, tuple(sorted(ingredients)), int(round(target_calories / self.bucket_kcal)))
+
+    def get(self, key, accept=None):
+        """
+        (rows, grams) cached under ``key``, REJECTED, or None; an entry for
+        which ``accept(rows, grams)`` is false counts as a (stale) miss
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is not None and entry[1] is not None and accept is not None and not accept(entry[1], entry[2]):
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if entry[1] is None:
+                self.rejected_hits += 1
+                return REJECTED
+            return entry[1], entry[2]
+
+    def put(self, key, rows, grams):
+        with self.lock:
+            self.entries[key] = (time.time(), rows, grams)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def reject(self, key):
+        """
+        Remember that the recipe under ``key`` has no acceptable portions
+        """
+        self.put(key, None, None)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'rejected_hits': self.rejected_hits,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # ---------------- Persistence ----------------
+    def save(self, path):
+        """
+        Write unexpired entries to a JSON file (atomically)
+        """
+        now = time.time()
+        with self.lock:
+            entries = [
+                [solver, list(ings), bucket, stored_at,
+                 None if rows is None else rows.tolist(), None if grams is None else grams.tolist()]
+                for (solver, ings, bucket), (stored_at, rows, grams) in self.entries.items()
+                if now - stored_at <= self.ttl
+            ]
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': self.version, 'bucket_kcal': self.bucket_kcal, 'entries': entries}, f)
+        os.replace(tmp_path, path)
+        return len(entries)
+
+    def load(self, path):
+        """
+        Restore entries saved by save(); returns how many were loaded
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read portion cache {path}: {e}")
+            return 0
+        if data.get('version') != self.version or data.get('bucket_kcal') != self.bucket_kcal:
+            return 0
+
+        now = time.time()
+        with self.lock:
+            for solver, ings, bucket, stored_at, rows, grams in data.get('entries', []):
+                if now - stored_at <= self.ttl:
+                    self.entries[(solver, tuple(ings), bucket)] = (stored_at, None, None) if rows is None else (
+                        stored_at, np.array(rows, dtype=np.intp), np.array(grams, dtype=np.float64)
+                    )
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return len(self.entries)
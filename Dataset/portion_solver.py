@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# -------------------------------------------
+# Batched portion solver
+# -------------------------------------------
+# Relative-error weights for calories, protein, fat, carbs, fiber (same as the SLSQP objective)
+MACRO_WEIGHTS = np.array([3.0, 2.0, 1.0, 1.0, 0.5])
+
+# Extra weight on the calorie error; stands in for SLSQP's hard 95-105% constraint
+CALORIE_WEIGHT = 50.0
+
+# Meal size outside 150-600g is penalized (portions are in 100g units)
+SIZE_RANGE = (1.5, 6.0)
+SIZE_WEIGHT = 1.0
+
+# Small pull towards the middle of the bounds; makes the minimum unique, so a
+# warm-started solve converges to the same portions as a cold one
+MIDDLE_WEIGHT = 1e-3
+
+class SolutionCache:
+    """
+    LRU of portion solutions per ingredient set (rows key), shared by all requests.
+
+    The last ``per_key`` solutions of each ingredient set are kept with the
+    problem (targets and bounds) they solve. The same problem again returns
+    its solution; any other problem on the set is warm-started from the
+    solution whose targets are nearest. The objective has a unique minimum
+    (see MIDDLE_WEIGHT) and solves run to a tight ``tol``, so a warm start
+    only changes how fast the solve converges, not the portions it returns.
+    """
+
+    def __init__(self, maxsize=4096, per_key=8):
+        self.maxsize = maxsize
+        self.per_key = per_key
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, key, problem):
+        """
+        (solution of ``problem``, None) when it was solved before, otherwise
+        (None, warm start or None)
+        """
+        with self.lock:
+            solved = self.entries.get(key)
+            if solved is None:
+                return None, None
+            self.entries.move_to_end(key)
+            solved = list(solved)
+        for cached, solution in solved:
+            if cached == problem:
+                return solution, None
+        target = np.asarray(problem[0])
+        distance = [np.max(np.abs(np.asarray(cached[0]) - target) / (target + 1e-12)) for cached, _ in solved]
+        return None, solved[int(np.argmin(distance))][1]
+
+    def put(self, key, problem, solution):
+        with self.lock:
+            solved = self.entries.setdefault(key, [])
+            solved.append((problem, solution))
+            del solved[:-self.per_key]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+solution_cache = SolutionCache()
+
+def solve_portions_batch(matrices, lower, upper, targets, keys=None, cache=solution_cache,
+                         max_iter=2000, tol=1e-8):
+    """
+    Solve many bounded portion problems at once.
+
+    Each problem minimizes the weighted squared relative macro error
+        sum_j w_j ((A p - t)_j / t_j)^2 + CALORIE_WEIGHT ((a_cal p - t_cal) / t_cal)^2
+        + SIZE_WEIGHT * (squared distance of sum(p) from SIZE_RANGE)
+        + MIDDLE_WEIGHT * |p - middle of the bounds|^2
+    subject to lower <= p <= upper. The objective is a smooth, strongly convex
+    quadratic, so it is solved with accelerated projected gradient descent
+    (FISTA with adaptive restart) using its analytic gradient and Lipschitz
+    constant. Problems are zero-padded to the same ingredient count and
+    iterated together as 3-D arrays.
+
+    matrices: list of (n_i x 5) per-100g nutrition matrices
+    lower, upper: lists of n_i portion bounds in 100g units
+    targets: list of 5-element macro targets
+    keys: optional hashable per problem identifying its matrix (e.g. tuple of nutrient
+          rows); with keys, solutions are cached per key and warm-start later
+          solves on the same key (see SolutionCache)
+    Returns a list of n_i portion arrays in 100g units.
+    """
+    if len(matrices) == 0:
+        return []
+    solutions, starts = [None] * len(matrices), [None] * len(matrices)
+    if keys is not None and cache is not None:
+        problems = [(tuple(map(float, target)), tuple(map(float, low)), tuple(map(float, high)))
+                    for target, low, high in zip(targets, lower, upper)]
+        for b, (key, problem) in enumerate(zip(keys, problems)):
+            solutions[b], starts[b] = cache.lookup(key, problem)
+    pending = [b for b, solution in enumerate(solutions) if solution is None]
+    if pending:
+        solved = _solve_batch([matrices[b] for b in pending], [lower[b] for b in pending],
+                              [upper[b] for b in pending], [targets[b] for b in pending], max_iter, tol,
+                              [starts[b] for b in pending])
+        for b, solution in zip(pending, solved):
+            solutions[b] = solution
+            if keys is not None and cache is not None:
+                cache.put(keys[b], problems[b], solution)
+    return [solution.copy() for solution in solutions]
+
+def _solve_batch(matrices, lower, upper, targets, max_iter, tol, starts=None):
+    batch = len(matrices)
+    width = max(max(len(m) for m in matrices), 1)
+
+    A = np.zeros((batch, width, len(MACRO_WEIGHTS)))
+    lo = np.zeros((batch, width))
+    hi = np.zeros((batch, width))
+    for b, (matrix, low, high) in enumerate(zip(matrices, lower, upper)):
+        A[b, :len(matrix)] = matrix
+        lo[b, :len(low)] = low
+        hi[b, :len(high)] = high
+    T = np.asarray(targets, dtype=np.float64)
+    middle = (lo + hi) / 2
+
+    # Per-macro weights on the absolute error (relative error -> divide by target^2)
+    d = MACRO_WEIGHTS / (T ** 2 + 1e-12)
+    d[:, 0] += CALORIE_WEIGHT / (T[:, 0] ** 2 + 1e-12)
+
+    # Lipschitz constant of the gradient: largest eigenvalue of the Hessian
+    active = (hi > 0).astype(np.float64)
+    hessian = 2 * np.einsum('bik,bk,bjk->bij', A, d, A)
+    hessian += 2 * SIZE_WEIGHT * active[:, :, None] * active[:, None, :]
+    hessian += 2 * MIDDLE_WEIGHT * np.eye(width)
+    step = 1 / (np.linalg.eigvalsh(hessian)[:, -1:] + 1e-12)
+
+    # Start from the given points (warm starts), or the middle of the bounds
+    x = middle.copy()
+    for b, start in enumerate(starts or []):
+        if start is not None:
+            x[b, :len(start)] = start
+    x = np.clip(x, lo, hi)
+
+    # Iterate only the problems that have not converged yet
+    solved = x.copy()
+    idx = np.arange(batch)
+    y, momentum = x.copy(), np.ones((batch, 1))
+    for iteration in range(1, max_iter + 1):
+        residual = np.einsum('bik,bi->bk', A, y) - T
+        grad = 2 * np.einsum('bik,bk->bi', A, d * residual)
+        total = y.sum(axis=1, keepdims=True)
+        grad += 2 * SIZE_WEIGHT * (np.maximum(total - SIZE_RANGE[1], 0) - np.maximum(SIZE_RANGE[0] - total, 0)) * active
+        grad += 2 * MIDDLE_WEIGHT * (y - middle)
+
+        x_next = np.clip(y - step * grad, lo, hi)
+        # Restart the momentum of problems where it points uphill (adaptive restart)
+        restart = np.sum((y - x_next) * (x_next - x), axis=1, keepdims=True) > 0
+        momentum = np.where(restart, 1.0, momentum)
+        momentum_next = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+        y = x_next + ((momentum - 1) / momentum_next) * (x_next - x)
+        change = np.max(np.abs(x_next - x), axis=1)
+        x, momentum = x_next, momentum_next
+
+        if iteration % 10 == 0 or iteration == max_iter:
+            done = change < tol
+            solved[idx[done]] = x[done]
+            if done.all() or iteration == max_iter:
+                solved[idx] = x
+                break
+            if done.any():
+                keep = ~done
+                idx, A, d, T, lo, hi, middle, active, step, momentum = (
+                    idx[keep], A[keep], d[keep], T[keep], lo[keep], hi[keep], middle[keep], active[keep],
+                    step[keep], momentum[keep]
+                )
+                x, y = x[keep], y[keep]
+    x = solved
+
+    return [x[b, :len(matrices[b])].copy() for b in range(batch)]
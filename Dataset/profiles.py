@@ -0,0 +1,40 @@
+import numpy as np
+
+# -------------------------------------------
+# Sample request profiles
+# -------------------------------------------
+# Shared by the benchmark suite and the load generators; kept free of the
+# recommendation imports so load tools start without loading the models.
+GOALS = ['weight_loss', 'weight_gain', 'maintain']
+TYPES = ['vegetarian', 'non-vegetarian']
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snack', 'general']
+ACTIVITIES = ['walking', 'yoga', 'dancing', 'weight training', 'cycling', 'running', 'hiit']
+HEALTH_CONDITIONS = [[], [], ['diabetes'], ['hypertension'], ['asthma'], ['diabetes', 'hypertension'], ['allergy']]
+ALLERGENS = ['milk', 'egg', 'peanut', 'wheat', 'soy', 'fish', 'sesame']
+EXCLUDE_SIZES = [0, 0, 5, 20, 100]
+
+def sample_profiles(count, seed=0, max_recipe_id=None):
+    """
+    Random /recommend request bodies across goals, diet types, meal types,
+    health conditions and exclude-list sizes (ids below ``max_recipe_id``)
+    """
+    rng = np.random.default_rng(seed)
+    profiles = []
+    for _ in range(count):
+        conditions = HEALTH_CONDITIONS[rng.integers(len(HEALTH_CONDITIONS))]
+        excluded = EXCLUDE_SIZES[rng.integers(len(EXCLUDE_SIZES))] if max_recipe_id else 0
+        profiles.append({
+            "gender": int(rng.integers(2)),
+            "age": int(rng.integers(18, 75)),
+            "height_cm": round(float(rng.normal(170, 10)), 1),
+            "weight_kg": round(float(np.clip(rng.normal(75, 15), 40, 180)), 1),
+            "goal": GOALS[rng.integers(len(GOALS))],
+            "Type": TYPES[rng.integers(len(TYPES))],
+            "meal_type": MEAL_TYPES[rng.integers(len(MEAL_TYPES))],
+            "health_conditions": list(conditions),
+            "allergies": rng.choice(ALLERGENS, 2, replace=False).tolist() if 'allergy' in conditions else [],
+            "activity_type": ACTIVITIES[rng.integers(len(ACTIVITIES))],
+            "exclude_recipe_names": [],
+            "exclude_recipe_ids": rng.integers(0, max_recipe_id, excluded).tolist() if excluded else [],
+        })
+    return profiles
@@ -0,0 +1,270 @@
+import argparse
+import ast
+import json
+import mmap
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------
+# Binary recipe dataset
+# -------------------------------------------
+# A directory next to the CSV (cleaned_recipes.csv -> cleaned_recipes.recipes/):
+#   meta.json                  columns, categories, row count and source CSV hash
+#   index.npy                  recipe ids (CSV row numbers)
+#   <column>.npy               float64 numeric columns, exactly as parsed from the CSV
+#   <column>.codes.npy         int16 codes of categorical columns (-1 = missing)
+#   <column>.bin               UTF-8 strings laid end to end
+#   <column>.offsets.npy       int64 byte offsets of each string in the .bin (n + 1)
+#   <column>.rows.npy          list columns only: string offsets of each row (rows + 1)
+# Every file is memory-mapped read-only: text columns are only decoded for the
+# rows that are read, and processes loading the same dataset share its pages.
+FORMAT_VERSION = 2
+
+# -------------------------------------------
+# Recipe ids
+# -------------------------------------------
+# A recipe's id (the 'RecipeId' of returned meals, which clients keep to
+# exclude recipes later) is its RecipeId column. The column is carried over
+# from the previous cleaned_recipes.csv when the dataset is regenerated (see
+# assign_recipe_ids()), so ids keep pointing to the same recipes after a
+# reload. A CSV without the column falls back to row numbers, which change
+# when rows are added, removed or reordered.
+ID_COLUMN = 'RecipeId'
+
+def read_recipes(recipe_path):
+    """
+    Recipe CSV indexed by recipe id; raises ValueError if the RecipeId column
+    has missing, negative or duplicate ids
+    """
+    recipe_df = pd.read_csv(recipe_path)
+    if ID_COLUMN not in recipe_df.columns:
+        return recipe_df
+    ids = pd.to_numeric(recipe_df[ID_COLUMN], errors='coerce')
+    if ids.isna().any() or (ids % 1 != 0).any() or (ids < 0).any() or ids.duplicated().any():
+        raise ValueError(f"{recipe_path}: {ID_COLUMN} must be unique non-negative integers")
+    return recipe_df.drop(columns=ID_COLUMN).set_index(pd.Index(ids.astype(np.int64), name=ID_COLUMN))
+
+def recipe_identity(recipe_df):
+    """
+    What makes two rows the same recipe across dataset versions
+    """
+    return recipe_df['Name'].astype(str) + '\n' + recipe_df['RecipeInstructions'].astype(str)
+
+def assign_recipe_ids(recipe_df, previous_df=None):
+    """
+    ``recipe_df`` with a RecipeId column: recipes also in ``previous_df`` (a
+    read_recipes() frame, matched by name and instructions) keep their id,
+    new recipes get ids after the largest one used so far
+    """
+    recipe_df = recipe_df.drop(columns=ID_COLUMN, errors='ignore').reset_index(drop=True)
+    ids = np.full(len(recipe_df), -1, dtype=np.int64)
+    next_id = 0
+    if previous_df is not None and len(previous_df):
+        previous = pd.Series(previous_df.index.to_numpy(dtype=np.int64), index=recipe_identity(previous_df))
+        previous = previous[~previous.index.duplicated()]
+        identity = recipe_identity(recipe_df)
+        # Repeated recipes: only the first copy can keep the old id
+        matched = identity.isin(previous.index).to_numpy() & ~identity.duplicated().to_numpy()
+        ids[matched] = previous[identity[matched]].to_numpy()
+        next_id = int(previous_df.index.max()) + 1
+    new = ids < 0
+    ids[new] = next_id + np.arange(new.sum())
+    recipe_df.insert(0, ID_COLUMN, ids)
+    return recipe_df
+
+CATEGORICAL_COLUMNS = ['Type', 'MealType']
+EAGER_TEXT_COLUMNS = ['Name']
+LIST_COLUMNS = ['Images', 'RecipeInstructions', 'Keywords', 'RecipeIngredientParts']
+
+def recipe_data_path(recipe_path):
+    return os.path.splitext(recipe_path)[0] + '.recipes'
+
+def parse_list(value):
+    """
+    List stored as a Python repr string by mergedataset.ipynb; other text becomes a one-item list
+    """
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    if not isinstance(value, str):
+        return []
+    if value.startswith('['):
+        try:
+            parsed = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            parsed = None
+        if isinstance(parsed, (list, tuple)):
+            return [str(v) for v in parsed]
+    return [value]
+
+class LazyTextColumn:
+    """
+    Memory-mapped strings, or lists of strings when ``rows`` is given
+    """
+
+    def __init__(self, blob, offsets, rows=None):
+        self.blob = blob
+        self.offsets = offsets
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows if self.rows is not None else self.offsets) - 1
+
+    def string(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def __getitem__(self, i):
+        if self.rows is None:
+            return self.string(i)
+        return [self.string(j) for j in range(self.rows[i], self.rows[i + 1])]
+
+    def text(self, i):
+        """
+        Row ``i`` as one string (list items joined by newlines)
+        """
+        value = self[i]
+        return value if isinstance(value, str) else '\n'.join(value)
+
+    def contains(self, term):
+        """
+        Boolean mask of rows with an item containing ``term`` (case-insensitive),
+        found by scanning the mapped bytes instead of decoding every row
+        """
+        pattern = re.compile(re.escape(term.encode('utf-8')), re.IGNORECASE)
+        hits = np.array([m.start() for m in pattern.finditer(self.blob)], dtype=np.int64)
+        items = np.searchsorted(self.offsets, hits, side='right') - 1
+        items = items[hits + len(term.encode('utf-8')) <= self.offsets[items + 1]]
+        if self.rows is not None:
+            items = np.searchsorted(self.rows, items, side='right') - 1
+        mask = np.zeros(len(self), dtype=bool)
+        mask[items] = True
+        return mask
+
+
+def write_strings(directory, column, strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    with open(os.path.join(directory, column + '.bin'), 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(os.path.join(directory, column + '.offsets.npy'), offsets)
+
+def export_recipes(recipe_df, path, source_hash=''):
+    """
+    Write ``recipe_df`` (as read from the recipe CSV) in the binary format
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"  # workers starting together may export at the same time
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    meta = {
+        'format': FORMAT_VERSION, 'source_hash': source_hash, 'rows': len(recipe_df),
+        'float_columns': [], 'categorical': {}, 'text_columns': [], 'list_columns': [], 'lazy_columns': [],
+    }
+    np.save(os.path.join(tmp_path, 'index.npy'), recipe_df.index.to_numpy(dtype=np.int64))
+    for column in recipe_df.columns:
+        values = recipe_df[column]
+        if column in CATEGORICAL_COLUMNS:
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(tmp_path, column + '.codes.npy'), codes.astype(np.int16))
+            meta['categorical'][column] = [str(c) for c in categories]
+        elif pd.api.types.is_numeric_dtype(values):
+            np.save(os.path.join(tmp_path, column + '.npy'), values.to_numpy(dtype=np.float64))
+            meta['float_columns'].append(column)
+        elif column in LIST_COLUMNS:
+            lists = [parse_list(v) for v in values]
+            rows = np.zeros(len(lists) + 1, dtype=np.int64)
+            np.cumsum([len(items) for items in lists], out=rows[1:])
+            write_strings(tmp_path, column, [item for items in lists for item in items])
+            np.save(os.path.join(tmp_path, column + '.rows.npy'), rows)
+            meta['list_columns'].append(column)
+        else:
+            write_strings(tmp_path, column, ['' if pd.isna(v) else str(v) for v in values])
+            meta['text_columns'].append(column)
+            if column not in EAGER_TEXT_COLUMNS:
+                meta['lazy_columns'].append(column)
+    meta['lazy_columns'] += meta['list_columns']
+
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)  # another process exported it first
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_array(path, name):
+    return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+def open_text_column(path, column, is_list):
+    offsets = load_array(path, column + '.offsets')
+    rows = load_array(path, column + '.rows') if is_list else None
+    with open(os.path.join(path, column + '.bin'), 'rb') as f:
+        blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b''
+    return LazyTextColumn(blob, offsets, rows)
+
+def load_recipes(path):
+    """
+    Load a binary recipe dataset.
+
+    Returns (frame, lazy_text): ``frame`` holds the numeric, categorical and
+    name columns indexed by recipe id, and ``lazy_text`` maps each remaining
+    text column to a LazyTextColumn addressed by row position. Numeric
+    columns are views of the mapped files, not copies.
+    """
+    meta = read_meta(path)
+    if meta is None or meta.get('format') != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a recipe dataset in format {FORMAT_VERSION}")
+
+    index = pd.Index(load_array(path, 'index'), copy=False)
+    columns = {}
+    for column in meta['float_columns']:
+        columns[column] = load_array(path, column)
+    for column, categories in meta['categorical'].items():
+        codes = load_array(path, column + '.codes')
+        columns[column] = pd.Categorical.from_codes(codes, categories=categories)
+    for column in meta['text_columns']:
+        if column not in meta['lazy_columns']:
+            text = open_text_column(path, column, False)
+            columns[column] = np.array([text.string(i) for i in range(len(text))], dtype=object)
+
+    lazy_text = {
+        column: open_text_column(path, column, column in meta['list_columns'])
+        for column in meta['lazy_columns']
+    }
+    return pd.DataFrame(columns, index=index, copy=False), lazy_text
+
+def load_recipe_dataset(recipe_path, source_hash):
+    """
+    Binary dataset for the recipe CSV, exporting it first if it is missing or stale
+    """
+    path = recipe_data_path(recipe_path)
+    meta = read_meta(path)
+    if meta is None or meta.get('format') != FORMAT_VERSION or meta.get('source_hash') != source_hash:
+        print(f"🔄 Exporting {recipe_path} to {path}")
+        export_recipes(read_recipes(recipe_path), path, source_hash)
+    return load_recipes(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Give the recipes of a regenerated recipe CSV stable RecipeIds")
+    parser.add_argument('recipes', help="regenerated recipe CSV, rewritten with a RecipeId column")
+    parser.add_argument('--previous', default=None,
+                        help="recipe CSV the ids are carried over from (its row numbers if it has no RecipeId)")
+    args = parser.parse_args()
+
+    previous = read_recipes(args.previous) if args.previous else None
+    recipes = assign_recipe_ids(read_recipes(args.recipes), previous)
+    recipes.to_csv(args.recipes, index=False)
+    kept = 0 if previous is None else int(recipes[ID_COLUMN].isin(previous.index).sum())
+    print(f"✅ {len(recipes)} recipes in {args.recipes}, {kept} with their previous id")
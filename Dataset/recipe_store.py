@@ -0,0 +1,492 @@
+import base64
+import json
+import os
+import re
+import shutil
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from similarity_index import SimilarityIndex
+
+# Recipe columns used for nutrient-profile similarity
+RECIPE_NUTRIENT_COLUMNS = ['Calories', 'FatContent', 'CarbohydrateContent', 'ProteinContent', 'FiberContent']
+
+# Recipe text searched for allergens
+ALLERGEN_TEXT_COLUMNS = ['RecipeInstructions', 'RecipeIngredientParts']
+
+def partition_key(diet_type, meal_type):
+    return (str(diet_type).lower(), str(meal_type).lower())
+
+# -------------------------------------------
+# Recipe id bitmaps
+# -------------------------------------------
+# Recipe ids are the RecipeId values (see recipe_data). A set of ids can be sent as
+# a bitmap: bit i (little-endian within each byte) set means recipe id i,
+# zlib-compressed and base64url-encoded.
+def encode_id_bitmap(recipe_ids):
+    recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+    bits = np.zeros(recipe_ids.max() + 1 if len(recipe_ids) else 0, dtype=bool)
+    bits[recipe_ids] = True
+    return base64.urlsafe_b64encode(zlib.compress(np.packbits(bits, bitorder='little').tobytes())).decode()
+
+def decode_id_bitmap(text, size):
+    """
+    Recipe ids below ``size`` set in an encode_id_bitmap() string; raises
+    ValueError if it is malformed or decompresses to more than ``size`` bits
+    """
+    max_len = max((size + 7) // 8, 1)  # 0 would mean no limit
+    try:
+        inflater = zlib.decompressobj()
+        packed = inflater.decompress(base64.urlsafe_b64decode(text), max_len)
+    except (zlib.error, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid recipe id bitmap: {e}")
+    if inflater.unconsumed_tail:
+        raise ValueError(f"Invalid recipe id bitmap: longer than the {size} recipe ids")
+    recipe_ids = np.flatnonzero(np.unpackbits(np.frombuffer(packed, dtype=np.uint8), bitorder='little'))
+    return recipe_ids[recipe_ids < size]
+
+# -------------------------------------------
+# Health condition rules
+# -------------------------------------------
+def mentions(df, column, term):
+    """
+    Recipes whose ``column`` contains ``term`` (case-insensitive)
+    """
+    return df[column].astype(str).str.contains(term, na=False, case=False).to_numpy()
+
+# Condition name -> rule returning the recipes a user with that condition may eat.
+# Rules take the RecipeStore and run once per dataset load; add new conditions
+# with register_condition().
+HEALTH_CONDITION_RULES = {
+    'diabetes': lambda store: (store.frame['SugarContent'] <= 10).to_numpy(),
+    'hypertension': lambda store: (store.frame['SodiumContent'] <= 400).to_numpy(),
+    'asthma': lambda store: ~store.mentions('RecipeInstructions', 'dairy'),
+}
+
+def register_condition(name, rule):
+    HEALTH_CONDITION_RULES[name.lower()] = rule
+
+def coerce_nutrients(df):
+    """
+    Nutrient columns as numbers; columns that already are numeric are kept as they are (not copied)
+    """
+    for column in RECIPE_NUTRIENT_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
+# Recipes tokenized at a time when building the allergen index
+TOKEN_INDEX_CHUNK = 50_000
+
+# Allergen terms whose postings TokenIndex keeps (least recently used dropped first)
+TOKEN_INDEX_CACHED_TERMS = 64
+
+class TokenIndex:
+    """
+    Inverted index from word tokens to the recipe positions containing them.
+
+    A term made only of word characters occurs in a text exactly when it is a
+    substring of one of the text's word tokens, so ``containing(term)`` unions
+    the postings of every vocabulary token containing the term. This gives the
+    same answer as ``str.contains(term, case=False)`` without scanning the text.
+    Other terms return None and must be matched by scanning. The postings of
+    the last TOKEN_INDEX_CACHED_TERMS terms are kept for repeated allergens.
+    """
+
+    def __init__(self, texts, size):
+        # texts: (recipe positions, strings) chunks, possibly several per recipe.
+        # Chunks are tokenized one at a time so only one chunk's token strings
+        # exist at once; the vocabulary keeps first-appearance order across chunks.
+        vocab, pairs = {}, [np.zeros(0, dtype=np.int64)]
+        for positions, strings in texts:
+            strings = pd.Series(strings, dtype=object)
+            tokens = strings.dropna().astype(str).str.lower().str.findall(r'\w+').explode().dropna()
+            docs = np.asarray(positions)[tokens.index.to_numpy()]
+            codes, uniques = pd.factorize(tokens.to_numpy())
+            remap = np.array([vocab.setdefault(t, len(vocab)) for t in uniques], dtype=np.int64)
+            pairs.append(np.unique(remap[codes] * size + docs))
+
+        pairs = np.unique(np.concatenate(pairs))
+        self.vocab = pd.Index(list(vocab), dtype=object)
+        self.indices = (pairs % size).astype(np.intp)
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(pairs // size, minlength=len(vocab)))))
+        self.size = size
+        self.terms = OrderedDict()  # term -> postings
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_arrays(cls, vocab, indptr, indices, size):
+        index = cls.__new__(cls)
+        index.vocab = pd.Index(vocab, dtype=object)
+        index.indptr, index.indices, index.size = indptr, indices, size
+        index.terms = OrderedDict()
+        index.lock = threading.Lock()
+        return index
+
+    def containing(self, term):
+        """
+        Sorted recipe positions whose text contains ``term``, or None if the
+        term cannot be answered from the index
+        """
+        term = term.lower()
+        if not re.fullmatch(r'\w+', term):
+            return None
+        with self.lock:
+            postings = self.terms.get(term)
+            if postings is not None:
+                self.terms.move_to_end(term)
+                return postings
+        matches = np.flatnonzero(self.vocab.str.contains(term, regex=False))
+        postings = np.unique(np.concatenate(
+            [self.indices[self.indptr[m]:self.indptr[m + 1]] for m in matches] or [np.zeros(0, dtype=np.intp)]
+        ))
+        with self.lock:
+            self.terms[term] = postings
+            self.terms.move_to_end(term)
+            while len(self.terms) > TOKEN_INDEX_CACHED_TERMS:
+                self.terms.popitem(last=False)
+        return postings
+
+class RecipePartition:
+    """
+    Recipes of one (Type, MealType) with their similarity inputs prepared.
+
+    ``frame`` and ``nutrients`` are slices of the store's contiguous data, so
+    taking a partition does not copy any recipe rows. ``approximate`` adds
+    k-means cells to the similarity index of large partitions; ``index`` is
+    a SimilarityIndex loaded from a prebuilt store instead of building one.
+    """
+
+    def __init__(self, frame, nutrients, start=0, approximate=False, index=None):
+        self.frame = frame
+        self.nutrients = nutrients
+        self.start = start  # offset of this slice in the store
+        self.ids = frame.index.to_numpy(dtype=np.int64)  # recipe ids (see recipe_data.read_recipes)
+        if index is None:
+            from sklearn.preprocessing import MinMaxScaler  # imported here: loading a prebuilt store does not need it
+            scaler = MinMaxScaler().fit(nutrients)
+            index = SimilarityIndex(nutrients, scaler.scale_, scaler.min_, approximate)
+        self.index = index
+
+    def __len__(self):
+        return len(self.frame)
+
+class RecipeStore:
+    """
+    Recipe dataset prepared once for all requests.
+
+    Nutrient columns are coerced to numbers and rows with missing values are
+    dropped up front. Rows are then stably sorted by (Type, MealType), so every
+    partition is a contiguous slice that keeps the original index labels (and
+    therefore the original recipe ids) and the original row order.
+
+    ``lazy_text`` optionally maps text columns that are not in ``recipe_df`` to
+    LazyTextColumns addressed by row position in ``recipe_df`` (see recipe_data);
+    they are only decoded for rows returned by row().
+
+    ``similarity`` is 'exact' (the default) or 'approximate', which ranks
+    large partitions by their nearest k-means cells (see similarity_index).
+    """
+
+    def __init__(self, recipe_df, lazy_text=None, similarity='exact'):
+        if similarity not in ('exact', 'approximate'):
+            raise ValueError(f"Unknown similarity mode: {similarity}")
+        df = coerce_nutrients(recipe_df.copy())
+        valid = df[RECIPE_NUTRIENT_COLUMNS + ['Type', 'MealType']].notna().all(axis=1).to_numpy()
+        df = df[valid]
+
+        type_codes, types = pd.factorize(df['Type'].str.lower())
+        meal_codes, meals = pd.factorize(df['MealType'].str.lower())
+        codes = type_codes * len(meals) + meal_codes
+        order = np.argsort(codes, kind='stable')
+        self.frame = df.iloc[order]
+        self.source_rows = len(recipe_df)
+        self.lazy_text = lazy_text or {}
+        self.text_positions = np.flatnonzero(valid)[order]  # row of each recipe in the lazy text columns
+        self.nutrients = np.ascontiguousarray(self.frame[RECIPE_NUTRIENT_COLUMNS].to_numpy(dtype=np.float64))
+
+        codes = codes[order]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(codes)) + 1, [len(codes)]))
+        self.similarity = similarity
+        self.partitions = {}
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            key = (types[codes[start] // len(meals)], meals[codes[start] % len(meals)])
+            self.partitions[key] = RecipePartition(
+                self.frame.iloc[start:stop], self.nutrients[start:stop], start, similarity == 'approximate'
+            )
+
+        self.max_id = int(self.frame.index.max()) if len(self.frame) else -1
+
+        # Health-condition masks over all store rows, evaluated once
+        self.condition_masks = {}
+        self.evaluate_conditions()
+        self._token_index = None
+
+    def evaluate_conditions(self):
+        """
+        Masks of the registered health conditions that do not have one yet
+        """
+        for name, rule in HEALTH_CONDITION_RULES.items():
+            if name not in self.condition_masks:
+                self.condition_masks[name] = np.asarray(rule(self), dtype=bool)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def partition(self, diet_type, meal_type):
+        """
+        Partition for a (Type, MealType) pair, or None if there are no such recipes
+        """
+        return self.partitions.get(partition_key(diet_type, meal_type))
+
+    def row(self, pos):
+        """
+        Recipe at store row ``pos`` as a Series, including its lazy text columns
+        """
+        row = self.frame.iloc[pos]
+        if not self.lazy_text:
+            return row
+        text_pos = self.text_positions[pos]
+        lazy = pd.Series({column: text[text_pos] for column, text in self.lazy_text.items()}, dtype=object)
+        return pd.concat([row.astype(object), lazy])
+
+    def has_column(self, column):
+        return column in self.frame.columns or column in self.lazy_text
+
+    def text_values(self, column, start=0, stop=None):
+        """
+        Rows [start, stop) of ``column`` as an object array of strings (decodes lazy columns)
+        """
+        if column in self.lazy_text:
+            text = self.lazy_text[column]
+            return np.array([text.text(i) for i in self.text_positions[start:stop]], dtype=object)
+        return self.frame[column].to_numpy(dtype=object)[start:stop]
+
+    def mentions(self, column, term, start=0, stop=None):
+        """
+        Rows in [start, stop) whose ``column`` contains ``term`` (case-insensitive).
+        Lazy columns are searched in their mapped bytes and match ``term`` literally.
+        """
+        stop = len(self.frame) if stop is None else stop
+        if column in self.lazy_text:
+            return self.lazy_text[column].contains(term)[self.text_positions[start:stop]]
+        return mentions(self.frame.iloc[start:stop], column, term)
+
+    @property
+    def token_index(self):
+        """
+        Allergen index over ALLERGEN_TEXT_COLUMNS, built on first use
+        """
+        if self._token_index is None:
+            chunk = TOKEN_INDEX_CHUNK
+            texts = (
+                (np.arange(start, min(start + chunk, len(self.frame))), self.text_values(column, start, start + chunk))
+                for column in ALLERGEN_TEXT_COLUMNS if self.has_column(column)
+                for start in range(0, len(self.frame), chunk)
+            )
+            self._token_index = TokenIndex(texts, len(self.frame))
+        return self._token_index
+
+    def allergen_mask(self, allergen, start=0, stop=None):
+        """
+        Recipes in rows [start, stop) that do not mention ``allergen``
+        """
+        stop = len(self.frame) if stop is None else stop
+        keep = np.ones(stop - start, dtype=bool)
+        postings = self.token_index.containing(allergen)
+        if postings is None:
+            for column in ALLERGEN_TEXT_COLUMNS:
+                if self.has_column(column):
+                    keep &= ~self.mentions(column, allergen, start, stop)
+            return keep
+        lo, hi = np.searchsorted(postings, [start, stop])
+        keep[postings[lo:hi] - start] = False
+        return keep
+
+    def exclusion_mask(self, partition, recipe_ids):
+        """
+        Recipes in ``partition`` whose id is not in ``recipe_ids``
+        """
+        recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+        recipe_ids = recipe_ids[(recipe_ids >= 0) & (recipe_ids <= self.max_id)]
+        excluded = np.zeros(self.max_id + 1, dtype=bool)
+        excluded[recipe_ids] = True
+        return ~excluded[partition.ids]
+
+    def condition_mask(self, partition, health_conditions, allergies=()):
+        """
+        Recipes in ``partition`` allowed by all the user's health conditions.
+
+        Registered conditions use the precomputed masks; 'allergy' excludes
+        recipes mentioning any of ``allergies``. Unknown conditions are ignored.
+        """
+        start, stop = partition.start, partition.start + len(partition)
+        keep = np.ones(stop - start, dtype=bool)
+        for cond in {c.lower() for c in health_conditions}:
+            if cond in self.condition_masks:
+                keep &= self.condition_masks[cond][start:stop]
+            elif cond == 'allergy':
+                for allergen in {a.lower() for a in allergies}:
+                    keep &= self.allergen_mask(allergen, start, stop)
+        return keep
+
+    def memory_usage(self):
+        """
+        Approximate bytes held by the store's frame and arrays
+        """
+        arrays = self.nutrients.nbytes + sum(p.index.nbytes for p in self.partitions.values())
+        arrays += sum(mask.nbytes for mask in self.condition_masks.values())
+        arrays += sum(text.offsets.nbytes for text in self.lazy_text.values())
+        if self._token_index is not None:
+            arrays += self._token_index.indices.nbytes + self._token_index.indptr.nbytes
+        return int(self.frame.memory_usage(deep=True).sum()) + arrays
+
+# -------------------------------------------
+# Prebuilt store
+# -------------------------------------------
+# Everything RecipeStore prepares from the recipe data, saved next to the CSV
+# as <name>.store/ so a server starts without fitting scalers, normalizing
+# partitions, evaluating health conditions or tokenizing recipe text:
+#   meta.json              source CSV hash, similarity mode, partitions, conditions, frame columns
+#   text_positions.npy     recipe_df row of each store row (rows are sorted by partition)
+#   frame.index.npy        recipe id of each store row
+#   frame.<column>.npy     numeric frame columns (codes for categorical ones) in store row order
+#   nutrients.npy          RECIPE_NUTRIENT_COLUMNS of each store row
+#   p<i>.<array>.npy       similarity index arrays of partition i
+#   condition<i>.npy       health-condition masks
+#   tokens.txt             allergen index vocabulary, one token per line
+#   tokens.indptr.npy / tokens.indices.npy   its postings
+# Arrays are memory-mapped when loaded, so loading takes milliseconds and
+# processes loading the same store (uvicorn workers, the recommendation pool)
+# share its pages instead of each holding a copy. Only text columns of the
+# frame (the recipe names) are taken from recipe_df in every process.
+STORE_FORMAT_VERSION = 3
+
+def recipe_store_path(recipe_path):
+    return os.path.splitext(recipe_path)[0] + '.store'
+
+def save_recipe_store(store, path, source_hash=''):
+    """
+    Write ``store`` (building its allergen index first) as a prebuilt store at ``path``
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    save = lambda name, array: np.save(os.path.join(tmp_path, name + '.npy'), np.asarray(array))
+
+    partitions = []
+    for i, (key, partition) in enumerate(store.partitions.items()):
+        partitions.append([key[0], key[1], int(partition.start), int(partition.start + len(partition))])
+        for name, array in partition.index.arrays().items():
+            save(f'p{i}.{name}', array)
+    save('text_positions', store.text_positions)
+    save('frame.index', store.frame.index.to_numpy(dtype=np.int64))
+    frame_columns = {}
+    for column in store.frame.columns:
+        values = store.frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            save(f'frame.{column}', values.cat.codes)
+            frame_columns[column] = 'codes'
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+            save(f'frame.{column}', values.to_numpy())
+            frame_columns[column] = 'values'
+        else:
+            frame_columns[column] = 'source'
+    save('nutrients', store.nutrients)
+    conditions = list(store.condition_masks)
+    for i, name in enumerate(conditions):
+        save(f'condition{i}', store.condition_masks[name])
+
+    tokens = store.token_index
+    with open(os.path.join(tmp_path, 'tokens.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(tokens.vocab))
+    save('tokens.indptr', tokens.indptr)
+    save('tokens.indices', tokens.indices.astype(np.int32 if tokens.size < 2 ** 31 else np.int64))
+
+    meta = {
+        'format': STORE_FORMAT_VERSION, 'source_hash': source_hash, 'similarity': store.similarity,
+        'rows': int(store.source_rows), 'partitions': partitions, 'conditions': conditions,
+        'frame_columns': frame_columns,
+    }
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)  # another process saved it first
+
+def load_prebuilt_store(path, recipe_df, lazy_text=None):
+    """
+    RecipeStore for ``recipe_df`` (the data the store was built from) with
+    everything else memory-mapped from the prebuilt store at ``path``
+    """
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+    store = RecipeStore.__new__(RecipeStore)
+    store.text_positions = load('text_positions')
+    columns = {}
+    for column, kind in meta['frame_columns'].items():
+        if kind == 'codes':
+            columns[column] = pd.Categorical.from_codes(load(f'frame.{column}'), dtype=recipe_df[column].dtype)
+        elif kind == 'values':
+            columns[column] = load(f'frame.{column}')
+        else:
+            columns[column] = recipe_df[column].array.take(store.text_positions)
+    index = pd.Index(load('frame.index'), name=recipe_df.index.name, copy=False)
+    store.frame = pd.DataFrame(columns, index=index, copy=False)
+    store.lazy_text = lazy_text or {}
+    store.source_rows = len(recipe_df)
+    store.nutrients = load('nutrients')
+    store.similarity = meta['similarity']
+    store.partitions = {}
+    for i, (diet_type, meal_type, start, stop) in enumerate(meta['partitions']):
+        nutrients = store.nutrients[start:stop]
+        arrays = {
+            name: load(f'p{i}.{name}') for name in SimilarityIndex.ARRAYS
+            if os.path.exists(os.path.join(path, f'p{i}.{name}.npy'))
+        }
+        store.partitions[(diet_type, meal_type)] = RecipePartition(
+            store.frame.iloc[start:stop], nutrients, start, index=SimilarityIndex.from_arrays(nutrients, arrays)
+        )
+    store.max_id = int(store.frame.index.max()) if len(store.frame) else -1
+    store.condition_masks = {name: load(f'condition{i}') for i, name in enumerate(meta['conditions'])}
+    store.evaluate_conditions()  # conditions registered after the store was built
+
+    indptr = load('tokens.indptr')
+    with open(os.path.join(path, 'tokens.txt'), encoding='utf-8') as f:
+        vocab = f.read().split('\n') if len(indptr) > 1 else []
+    store._token_index = TokenIndex.from_arrays(vocab, indptr, load('tokens.indices'), len(store.frame))
+    return store
+
+def load_recipe_store(recipe_path, recipe_df, lazy_text=None, source_hash='', similarity='exact'):
+    """
+    RecipeStore of the recipe CSV, loaded from its prebuilt store when that
+    was built from the same CSV content and similarity mode, otherwise
+    prepared from ``recipe_df`` and saved for the next start
+    """
+    path = recipe_store_path(recipe_path)
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if (meta.get('format'), meta.get('source_hash'), meta.get('similarity'), meta.get('rows')) == \
+                (STORE_FORMAT_VERSION, source_hash, similarity, len(recipe_df)):
+            return load_prebuilt_store(path, recipe_df, lazy_text)
+        print(f"🔄 {path} is stale, rebuilding")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Could not read {path}: {e}, rebuilding")
+
+    store = RecipeStore(recipe_df, lazy_text=lazy_text, similarity=similarity)
+    try:
+        save_recipe_store(store, path, source_hash)
+    except OSError as e:
+        print(f"❌ Could not save {path}: {e}")
+    return store
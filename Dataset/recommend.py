@@ -1,13 +1,55 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future
+from itertools import chain
 import pandas as pd
 import re
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
-from scipy.optimize import minimize
 
-# Load nutrient data
-nutrient = pd.read_csv('nutrient_cleaned.csv')
-calorie_lookup = dict(zip(nutrient['food'].str.lower(), nutrient['calories']))
+from metrics import NULL_TIMER, StageTimer
+from portion_bounds import PortionBounds, portion_scale
+from portion_cache import PortionCache
+from portion_solver import solve_portions_batch
+from recipe_data import read_recipes
+from recipe_store import RecipeStore
+
+# Nutrient data, loaded below as default_nutrients (see NutrientData)
+NUTRIENT_PATH = os.environ.get('NUTRIENT_PATH', 'nutrient_cleaned.csv')
+
+# -------------------------------------------
+# Nutrient Table
+# -------------------------------------------
+NUTRIENT_COLUMNS = ['calories', 'protein', 'fat', 'carbs', 'fiber', 'sodium']
+MACROS = NUTRIENT_COLUMNS[:5]  # calories, protein, fat, carbs, fiber
+
+class NutrientTable:
+    """
+    Per-100g nutrient values as a float64 matrix (foods x NUTRIENT_COLUMNS)
+    with a lowercase food name -> row index lookup
+    """
+
+    def __init__(self, nutrient_df):
+        self.foods = nutrient_df['food'].str.lower().tolist()
+        self.index = {food: i for i, food in enumerate(self.foods)}
+        self.matrix = nutrient_df[NUTRIENT_COLUMNS].fillna(0).to_numpy(dtype=np.float64)
+
+    def rows(self, foods):
+        """
+        Row indices of the known foods, in the given order
+        """
+        return np.array([self.index[f] for f in (f.lower() for f in foods) if f in self.index], dtype=np.intp)
+
+    def totals(self, rows, grams):
+        """
+        Nutrient totals (one value per NUTRIENT_COLUMNS entry) for grams of each row
+        """
+        return (np.asarray(grams, dtype=np.float64) / 100) @ self.matrix[rows]
+
 
 # -------------------------------------------
 # Helper Functions
@@ -131,7 +173,6 @@ portion_guidelines = {
     'potato': (120, 200),
     'sweet potato': (120, 200),
     'bell pepper': (50, 100),
-    'pepper': (50, 100),
     'cucumber': (80, 150),
     'zucchini': (80, 150),
     'cauliflower': (80, 150),
@@ -287,106 +328,312 @@ portion_guidelines = {
     'guacamole': (25, 50),
 }
 
-def get_realistic_portions(ing_name, target_calories=400):
+def get_realistic_portions(ing_name, target_calories=400, nutrients=None):
     """
     Get realistic portion sizes with calorie-based scaling
     """
-    ing_lower = ing_name.lower()
-    base_min, base_max = portion_guidelines.get('default', (50, 150))
-    
-    # Find specific ingredient guidelines
-    for key, (min_g, max_g) in portion_guidelines.items():
-        if key in ing_lower or ing_lower in key:
-            base_min, base_max = min_g, max_g
-            break
-    
-    # Scale portions based on target meal size
-    if target_calories < 300:  # Small meal
-        scale_factor = 0.8
-    elif target_calories > 600:  # Large meal
-        scale_factor = 1.2
-    else:  # Normal meal
-        scale_factor = 1.0
-    
+    base_min, base_max = (nutrients or default_nutrients).bounds.base(ing_name.lower())
+    scale_factor = float(portion_scale(target_calories))
     return (int(base_min * scale_factor), int(base_max * scale_factor))
 
-def extract_ingredients(row):
+# -------------------------------------------
+# Ingredient Index
+# -------------------------------------------
+class IngredientIndex:
+    """
+    Finds every nutrient-database food mentioned in a text in a single pass.
+
+    All food names are compiled into one trie-shaped regex, so each word boundary
+    in the text is tried once instead of once per food. The regex reports the
+    longest food starting at a position; shorter foods that are whole-word
+    prefixes of it (e.g. "egg" inside "egg white") are added from a table
+    computed up front, which keeps the result identical to searching for every
+    food separately as a whole word.
     """
-    Extract ingredients from recipe that exist in nutrient database
+
+    def __init__(self, foods):
+        self.foods = list(dict.fromkeys(f.lower() for f in foods))
+        self.order = {food: i for i, food in enumerate(self.foods)}
+        self.pattern = re.compile(rf'\b(?=({self._trie_pattern(self.foods)})\b)')
+
+        # Foods that also match wherever a longer food matches
+        word_char = re.compile(r'\w')
+        self.prefixes = {
+            longer: [
+                food for food in self.foods
+                if food != longer and longer.startswith(food)
+                and bool(word_char.match(food[-1])) != bool(word_char.match(longer[len(food)]))
+            ]
+            for longer in self.foods
+        }
+
+    @staticmethod
+    def _trie_pattern(words):
+        trie = {}
+        for word in words:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[''] = True
+
+        def to_regex(node):
+            branches = [re.escape(ch) + to_regex(child) for ch, child in sorted(node.items()) if ch != '']
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            # Greedy optional group: longest food first, backtrack to shorter ones
+            return f'(?:{body})?' if '' in node else body
+
+        return to_regex(trie)
+
+    def find(self, text):
+        """
+        Return the foods mentioned in text, in nutrient-table order
+        """
+        found = set()
+        for match in self.pattern.finditer(text.lower()):
+            food = match.group(1)
+            found.add(food)
+            found.update(self.prefixes[food])
+        return sorted(found, key=self.order.__getitem__)
+
+
+def recipe_text(row):
+    """
+    Combine instruction and ingredient text of a recipe row
     """
     instr = row.get('RecipeInstructions', '')
     ingredient_text = row.get('RecipeIngredientParts', '')
-    
-    # Combine instruction and ingredient text
-    combined_text = ' '.join(instr if isinstance(instr, list) else [str(instr)]) + ' ' + str(ingredient_text)
-    
-    # Find ingredients that exist in our nutrient database
-    found_ings = []
-    for ingredient in nutrient['food'].str.lower():
-        if re.search(rf'\b{re.escape(ingredient)}\b', combined_text.lower()):
-            found_ings.append(ingredient)
-    
-    return list(set(found_ings))
+    return ' '.join(instr if isinstance(instr, list) else [str(instr)]) + ' ' + str(ingredient_text)
+
+def extract_ingredients(row, nutrients=None):
+    """
+    Extract ingredients from recipe that exist in nutrient database
+    """
+    return (nutrients or default_nutrients).index.find(recipe_text(row))
+
+# -------------------------------------------
+# Precomputed Recipe -> Ingredient Table
+# -------------------------------------------
+def file_hash(path):
+    """
+    SHA-256 of a file's contents, used to detect dataset changes
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def ingredient_table_path(recipe_path):
+    return os.path.splitext(recipe_path)[0] + '.ingredients'
+
+# -------------------------------------------
+# Nutrient Data
+# -------------------------------------------
+class NutrientData:
+    """
+    One load of the nutrient database and the lookups built from it.
+
+    Functions that need nutrients take it as ``nutrients`` (default_nutrients
+    when None), so a dataset reload can build a new one while requests that
+    started on the old one keep using it. Pickling sends only (path, hash);
+    the receiving process loads the file once (see shared()).
+    """
+
+    def __init__(self, path=NUTRIENT_PATH):
+        with open(path, 'rb') as f:
+            content = f.read()  # hashed and parsed from the same bytes
+        self.path = path
+        self.hash = hashlib.sha256(content).hexdigest()
+        self.frame = pd.read_csv(io.BytesIO(content))
+        self.calorie_lookup = dict(zip(self.frame['food'].str.lower(), self.frame['calories']))
+        self.table = NutrientTable(self.frame)
+        self.bounds = PortionBounds(self.table.foods, portion_guidelines)
+        self.index = IngredientIndex(self.frame['food'])
+
+    def __reduce__(self):
+        return NutrientData.shared, (self.path, self.hash)
+
+    @staticmethod
+    def shared(path, expected_hash):
+        """
+        This process's NutrientData for ``path`` with content hash ``expected_hash``
+        """
+        data = _loaded_nutrients.get(expected_hash)
+        if data is None:
+            data = NutrientData(path)
+            if data.hash != expected_hash:
+                raise ValueError(f"{path} changed since it was loaded")
+            _loaded_nutrients[expected_hash] = data
+        return data
+
+
+default_nutrients = NutrientData()
+_loaded_nutrients = {default_nutrients.hash: default_nutrients}
+
+# Parts of default_nutrients under their older module-level names
+nutrient, calorie_lookup = default_nutrients.frame, default_nutrients.calorie_lookup
+nutrient_table, portion_bounds, ingredient_index = default_nutrients.table, default_nutrients.bounds, default_nutrients.index
+
+class IngredientTable:
+    """
+    Matched nutrient-database ingredients for every recipe, stored as CSR arrays.
+
+    The recipe with id ``i`` (its index label after recipe_data.read_recipes())
+    uses ``foods[indices[indptr[i]:indptr[i + 1]]]``; ids no recipe has get no
+    ingredients, so ``len(table)`` is the largest recipe id + 1.
 
-def calculate_actual_nutrition(optimized_quantities):
+    Saved as a directory (meta.json, indptr.npy, indices.npy) that load()
+    memory-maps, so processes loading the same table share its pages.
+    """
+
+    def __init__(self, foods, indptr, indices, recipe_hash, nutrient_hash):
+        self.foods = list(foods)
+        self.indptr = indptr
+        self.indices = indices
+        self.recipe_hash = recipe_hash
+        self.nutrient_hash = nutrient_hash
+        self.path = None  # directory the table was saved to or loaded from
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def lookup(self, recipe_id):
+        start, end = self.indptr[recipe_id], self.indptr[recipe_id + 1]
+        return [self.foods[i] for i in self.indices[start:end]]
+
+    @classmethod
+    def build(cls, recipe_df, recipe_hash='', nutrient_hash='', nutrients=None):
+        ingredient_index = (nutrients or default_nutrients).index
+        text_cols = [c for c in ('RecipeInstructions', 'RecipeIngredientParts') if c in recipe_df.columns]
+        found = [
+            [ingredient_index.order[food] for food in ingredient_index.find(recipe_text(row))]
+            for row in recipe_df[text_cols].to_dict('records')
+        ]
+        ids = recipe_df.index.to_numpy(dtype=np.int64)
+        counts = np.zeros(ids.max() + 1 if len(ids) else 0, dtype=np.int64)
+        counts[ids] = [len(f) for f in found]
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+        indices = [i for pos in np.argsort(ids, kind='stable') for i in found[pos]]
+        return cls(ingredient_index.foods, indptr, np.array(indices, dtype=np.int32), recipe_hash, nutrient_hash)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'indptr.npy'), self.indptr)
+        np.save(os.path.join(tmp_path, 'indices.npy'), self.indices)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'foods': self.foods, 'recipe_hash': self.recipe_hash, 'nutrient_hash': self.nutrient_hash}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)  # another process saved it first
+        self.path = path
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+        table = cls(meta['foods'], load('indptr'), load('indices'), meta['recipe_hash'], meta['nutrient_hash'])
+        table.path = path
+        return table
+
+def load_ingredient_table(recipe_path, recipe_df=None, nutrients=None):
+    """
+    Load the precomputed ingredient table stored next to the recipe CSV,
+    rebuilding it when either dataset's content hash no longer matches
+    """
+    nutrients = nutrients or default_nutrients
+    path = ingredient_table_path(recipe_path)
+    recipe_hash, nutrient_hash = file_hash(recipe_path), nutrients.hash
+
+    if os.path.exists(path):
+        try:
+            table = IngredientTable.load(path)
+            if table.recipe_hash == recipe_hash and table.nutrient_hash == nutrient_hash:
+                return table
+            print(f"🔄 {path} is stale, rebuilding")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Could not read {path}: {e}, rebuilding")
+
+    if recipe_df is None:
+        recipe_df = read_recipes(recipe_path)
+    table = IngredientTable.build(recipe_df, recipe_hash, nutrient_hash, nutrients)
+    table.save(path)
+    return table
+
+def calculate_actual_nutrition(rows, grams, nutrients=None):
     """
     Calculate actual nutrition from optimized ingredient quantities
     """
-    total_nutrition = {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0, 'fiber': 0}
-    
-    for ing, qty_str in optimized_quantities.items():
-        # Extract grams from string like "150g broccoli"
-        grams_match = re.search(r'(\d+)g', qty_str)
-        if grams_match:
-            grams = int(grams_match.group(1))
-            ing_data = nutrient[nutrient['food'].str.lower() == ing.lower()]
-            if not ing_data.empty:
-                multiplier = grams / 100  # per 100g
-                total_nutrition['calories'] += ing_data['calories'].values[0] * multiplier
-                total_nutrition['protein'] += ing_data['protein'].values[0] * multiplier
-                total_nutrition['fat'] += ing_data['fat'].values[0] * multiplier
-                total_nutrition['carbs'] += ing_data['carbs'].values[0] * multiplier
-                total_nutrition['fiber'] += ing_data['fiber'].values[0] * multiplier
-    
-    return total_nutrition
+    totals = (nutrients or default_nutrients).table.totals(rows, grams)
+    return {macro: float(value) for macro, value in zip(MACROS, totals)}
+
+def format_quantities(rows, grams, nutrients=None):
+    """
+    Readable quantities keyed by ingredient, e.g. {'broccoli': '150g broccoli'}
+    """
+    nutrient_table = (nutrients or default_nutrients).table
+    return {nutrient_table.foods[r]: f"{int(g)}g {nutrient_table.foods[r]}" for r, g in zip(rows, grams)}
+
+def portion_problem(ingredients, target_calories, nutrients=None):
+    """
+    Nutrient rows, per-100g nutrition matrix and portion bounds (100g units)
+    for the ingredients found in the nutrient database
+    """
+    nutrients = nutrients or default_nutrients
+    rows = nutrients.table.rows(ingredients)
+    min_g, max_g = nutrients.bounds.scaled(rows, target_calories)
+    bounds = list(zip((min_g / 100).tolist(), (max_g / 100).tolist()))  # Convert to 100g units
+    return rows, nutrients.table.matrix[rows][:, :len(MACROS)], bounds
 
-def optimize_ingredient_weights(ingredients, target_macros, recipe_name="", target_calories=400):
+def minimize(*args, **kwargs):
+    """
+    scipy.optimize.minimize, imported on the first SLSQP solve (SciPy takes about a second to import)
+    """
+    from scipy.optimize import minimize
+    return minimize(*args, **kwargs)
+
+def warm_solver(solver='slsqp'):
+    """
+    Import what ``solver`` needs now, so the first request does not wait for it
+    """
+    if solver == 'slsqp':
+        import scipy.optimize
+
+def to_grams(rows, portions):
+    """
+    Round portions (100g units) to whole grams and keep only meaningful amounts
+    """
+    grams = np.rint(np.asarray(portions) * 100)
+    keep = grams >= 3
+    return rows[keep], grams[keep]
+
+def optimize_ingredient_weights(ingredients, target_macros, recipe_name="", target_calories=400, solver='slsqp',
+                                timer=NULL_TIMER, nutrients=None):
     """
     Optimizes ingredient quantities to match target calories/macros
     Uses realistic portion sizes and cooking ratios with accuracy constraints (95-105%)
+
+    solver='slsqp' is the reference SLSQP solve; solver='lsq' uses the batched
+    least-squares solver (see optimize_ingredient_weights_batch).
+    SLSQP failures that fall back are counted on ``timer`` as 'solves_failed'.
+    Returns (rows, grams): nutrient_table row indices and whole-gram amounts
     """
-    if len(ingredients) == 0:
-        return {}
+    nutrients = nutrients or default_nutrients
+    if solver == 'lsq':
+        return optimize_ingredient_weights_batch([ingredients], [target_macros], [target_calories], nutrients)[0]
 
-    # Build nutrition matrix with realistic constraints
-    valid_ingredients = []
-    bounds = []
-    base_portions = []
-    
-    for ing in ingredients:
-        row = nutrient[nutrient['food'].str.lower() == ing.lower()]
-        if not row.empty:
-            valid_ingredients.append(ing)
-            min_g, max_g = get_realistic_portions(ing, target_calories)
-            bounds.append((min_g/100, max_g/100))  # Convert to 100g units
-            base_portions.append((min_g + max_g) / 200)  # Average as starting point
-
-    if len(valid_ingredients) == 0:
-        return {}
-
-    # Create nutrition matrix (per 100g)
-    nutrition_matrix = []
-    macros = ['calories', 'protein', 'fat', 'carbs', 'fiber']
-    
-    for ing in valid_ingredients:
-        row = nutrient[nutrient['food'].str.lower() == ing.lower()]
-        nutrition_row = []
-        for macro in macros:
-            value = row[macro].values[0] if macro in row.columns else 0
-            nutrition_row.append(value)
-        nutrition_matrix.append(nutrition_row)
-    
-    nutrition_matrix = np.array(nutrition_matrix)
+    rows, nutrition_matrix, bounds = portion_problem(ingredients, target_calories, nutrients)
+    if len(rows) == 0:
+        return rows, np.empty(0)
+
+    valid_ingredients = [nutrients.table.foods[r] for r in rows]
+    base_portions = [(min_p + max_p) / 2 for min_p, max_p in bounds]  # Average as starting point
     target = np.array(target_macros)
 
     def objective_function(portions):
@@ -439,42 +686,179 @@ def optimize_ingredient_weights(ingredients, target_macros, recipe_name="", targ
         if result.success:
             optimized_portions = result.x
         else:
+            timer.count('solves_failed')
             # Fallback with proportional scaling within bounds
-            total_base_calories = sum(
-                nutrition_matrix[i][0] * base_portions[i] 
-                for i in range(len(valid_ingredients))
-            )
+            total_base_calories = nutrition_matrix[:, 0] @ np.array(base_portions)
             
             if total_base_calories > 0:
                 # Scale to hit target calories within bounds
                 target_scale = min(1.05, max(0.95, target_macros[0] / total_base_calories))
-                optimized_portions = [p * target_scale for p in base_portions]
+                optimized_portions = np.array(base_portions) * target_scale
             else:
                 optimized_portions = base_portions
         
-        # Convert to readable format
-        quantities = {}
-        total_cals = 0
-        
-        for i, ing in enumerate(valid_ingredients):
-            grams = round(optimized_portions[i] * 100)
-            if grams >= 3:  # Only include meaningful amounts
-                quantities[ing] = f"{grams}g {ing}"
-                # Calculate calories for this ingredient
-                ing_cals = nutrition_matrix[i][0] * optimized_portions[i]
-                total_cals += ing_cals
-        
-        return quantities
+        return to_grams(rows, optimized_portions)
         
     except Exception as e:
         print(f"❌ Optimization failed for {recipe_name}: {e}")
-        # Simple fallback: reasonable portions
-        fallback_quantities = {}
-        for ing in valid_ingredients[:4]:  # Limit to 4 main ingredients
-            min_g, max_g = get_realistic_portions(ing, target_calories)
-            avg_g = (min_g + max_g) // 2
-            fallback_quantities[ing] = f"{avg_g}g {ing}"
-        return fallback_quantities
+        timer.count('solves_failed')
+        # Simple fallback: reasonable portions for the 4 main ingredients
+        fallback = [get_realistic_portions(ing, target_calories, nutrients) for ing in valid_ingredients[:4]]
+        return rows[:4], np.array([(min_g + max_g) // 2 for min_g, max_g in fallback], dtype=np.float64)
+
+def optimize_ingredient_weights_batch(ingredient_lists, target_macros_list, target_calories_list, nutrients=None):
+    """
+    Optimizes ingredient quantities for many recipes in one batched least-squares solve;
+    problems solved before come from the solver's cache, and new targets for an
+    ingredient set solved before are warm-started from its cached solutions
+
+    Returns a list of (rows, grams), one per recipe
+    """
+    nutrients = nutrients or default_nutrients
+    problems = [portion_problem(ings, tc, nutrients) for ings, tc in zip(ingredient_lists, target_calories_list)]
+    solutions = solve_portions_batch(
+        matrices=[matrix for _, matrix, _ in problems],
+        lower=[[b[0] for b in bounds] for _, _, bounds in problems],
+        upper=[[b[1] for b in bounds] for _, _, bounds in problems],
+        targets=target_macros_list,
+        keys=[(nutrients.hash, tuple(rows.tolist())) for rows, _, _ in problems],  # rows depend on the nutrient data
+    )
+    return [to_grams(rows, portions) for (rows, _, _), portions in zip(problems, solutions)]
+
+def fits_target(target_calories, nutrients=None):
+    """
+    Whether portions (rows, grams) give 95-105% of target_calories, the
+    acceptance check of suggest_diet(); PortionCache.get()'s ``accept``
+    """
+    def accept(rows, grams):
+        calories = calculate_actual_nutrition(rows, grams, nutrients)['calories']
+        return len(rows) > 0 and 0.95 * target_calories <= calories <= 1.05 * target_calories
+    return accept
+
+def cache_solution(cache, key, rows, grams, target_calories, nutrients=None):
+    """
+    Cache portions that pass the acceptance check, otherwise the recipe's rejection
+    """
+    if fits_target(target_calories, nutrients)(rows, grams):
+        cache.put(key, rows, grams)
+    else:
+        cache.reject(key)
+
+def solve_meal_portions(ingredient_lists, target_calories_list, recipe_names, solver='slsqp', cache=None,
+                        timer=NULL_TIMER, nutrients=None):
+    """
+    Portion solutions (rows, grams) for several candidate recipes.
+
+    With a PortionCache, results are memoized by (solver, ingredients, calorie
+    bucket); misses are solved at the actual target and a cached result is
+    only used when its calories are within 95-105% of this target. Recipes
+    whose solve was rejected in the same bucket come back with no portions,
+    without being solved again.
+    """
+    results = [None] * len(ingredient_lists)
+    targets = list(target_calories_list)
+    keys = [None] * len(ingredient_lists)
+    if cache is not None:
+        for i, (ings, target) in enumerate(zip(ingredient_lists, targets)):
+            keys[i] = cache.key(ings, target, solver)
+            results[i] = cache.get(keys[i], fits_target(target, nutrients))
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    timer.count('solves_attempted', len(pending))
+    if solver == 'lsq':
+        solved = optimize_ingredient_weights_batch(
+            [ingredient_lists[i] for i in pending],
+            [meal_target_macros(targets[i]) for i in pending],
+            [targets[i] for i in pending],
+            nutrients,
+        )
+    else:
+        solved = [
+            optimize_ingredient_weights(ingredient_lists[i], meal_target_macros(targets[i]), recipe_names[i], targets[i],
+                                        timer=timer, nutrients=nutrients)
+            for i in pending
+        ]
+
+    for i, (rows, grams) in zip(pending, solved):
+        results[i] = (rows, grams)
+        if cache is not None:
+            cache_solution(cache, keys[i], rows, grams, targets[i], nutrients)
+    return results
+
+# -------------------------------------------
+# Speculative Candidate Evaluation
+# -------------------------------------------
+def solve_portions_job(ingredients, target_calories, recipe_name, solver='slsqp', nutrients=None):
+    """
+    (rows, grams, failed solves, seconds) of one candidate; runs on a speculation executor
+    """
+    start = time.perf_counter()
+    timer = StageTimer()
+    rows, grams = optimize_ingredient_weights(
+        ingredients, meal_target_macros(target_calories), recipe_name, target_calories, solver, timer=timer,
+        nutrients=nutrients,
+    )
+    return rows, grams, timer.counts.get('solves_failed', 0), time.perf_counter() - start
+
+class SpeculativeSolves:
+    """
+    Portion solves of a chunk of ranked candidates running concurrently on an executor.
+
+    Iterating yields (rows, grams) in rank order, waiting for each solve in
+    turn, so acceptance stays exactly as deterministic as solving one
+    candidate after the other. cancel() drops the solves that have not
+    started once they are no longer needed; solves already running finish
+    in the background. With a PortionCache, hits skip the executor and
+    every finished solve is cached, including ones that were not needed.
+    """
+
+    def __init__(self, executor, ingredient_lists, target_calories_list, recipe_names, solver='slsqp', cache=None,
+                 timer=NULL_TIMER, nutrients=None):
+        self.timer = timer
+        self.solved, self.solve_seconds = 0, 0.0
+        self.futures = []
+        for ings, target, name in zip(ingredient_lists, target_calories_list, recipe_names):
+            key = hit = None
+            if cache is not None:
+                key = cache.key(ings, target, solver)
+                hit = cache.get(key, fits_target(target, nutrients))
+            if hit is not None:
+                future = Future()
+                future.set_result((*hit, 0, 0.0))
+            else:
+                future = executor.submit(solve_portions_job, ings, target, name, solver, nutrients)
+                timer.count('solves_attempted')
+                if cache is not None:
+                    future.add_done_callback(
+                        lambda f, key=key, target=target: self._cache_result(cache, key, target, nutrients, f)
+                    )
+            self.futures.append(future)
+
+    @staticmethod
+    def _cache_result(cache, key, target_calories, nutrients, future):
+        if not future.cancelled() and future.exception() is None:
+            rows, grams, _, _ = future.result()
+            cache_solution(cache, key, rows, grams, target_calories, nutrients)
+
+    def __len__(self):
+        return len(self.futures)
+
+    def __iter__(self):
+        try:
+            for future in self.futures:
+                start = time.perf_counter()
+                rows, grams, failed, seconds = future.result()
+                self.timer.add('solve', time.perf_counter() - start)  # time the request waited
+                self.timer.count('solves_failed', failed)
+                self.solved += seconds > 0
+                self.solve_seconds += seconds
+                yield rows, grams
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
 
 def inject_quantities_into_instructions(instructions, quantities):
     """
@@ -504,45 +888,255 @@ def inject_quantities_into_instructions(instructions, quantities):
     return '\n'.join(f"{i+1}. {line}" for i, line in enumerate(updated_steps))
 
 # -------------------------------------------
-# Main Function with Accuracy Constraints
+# Candidate Ranking
+# -------------------------------------------
+def nutrition_target_vector(cal_target):
+    """
+    Daily target in RECIPE_NUTRIENT_COLUMNS order, ranked against recipes by cosine similarity
+    """
+    return [
+        cal_target,
+        cal_target * 0.25 / 9,  # fat
+        cal_target * 0.5 / 4,   # carbs
+        cal_target * 0.25 / 4,  # protein
+        cal_target * 0.035      # fiber
+    ]
+
 # -------------------------------------------
-def suggest_diet(user_input: dict, recipe_df: pd.DataFrame, max_meals: int = 5, tolerance: float = 0.05, exclude_recipe_names: list = None):
+# Feasibility Pre-screen
+# -------------------------------------------
+# Meal-size classes of get_realistic_portions(): a target in each class
+PORTION_SCALE_TARGETS = (250, 400, 700)
+
+def portion_scale_class(target_calories):
+    return 0 if target_calories < 300 else 2 if target_calories > 600 else 1
 
+# Calorie ranges are saved next to a loaded ingredient table and memory-mapped
+# by the next process; bump this when their computation changes
+SCREEN_RANGES_VERSION = 2
+
+def save_array(path, array):
     """
-    Main function that suggests optimized diet plan with accuracy constraints (95-105%)
+    np.save() to ``path`` atomically; skipped when the directory is not writable
     """
-    # Validate input
-    validate_user_input(user_input)
-    
-    nutrient_cols = ['Calories', 'FatContent', 'CarbohydrateContent', 'ProteinContent', 'FiberContent']
-    df = recipe_df.copy()
+    tmp_path = f"{path}.tmp{os.getpid()}.npy"
+    try:
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"❌ Could not save {path}: {e}")
 
-    # ---------------- Filters ----------------
-    df = df[df['Type'].str.lower() == user_input['Type'].lower()]
-    df = df[df['MealType'].str.lower() == user_input['meal_type'].lower()]
+class FeasibilityScreen:
+    """
+    Calorie range each recipe's portion solve can possibly return.
+
+    For every recipe in the ingredient table and each portion scale class this
+    holds a lower and upper bound on the calories of an optimize_ingredient_weights
+    result: portions within the realistic bounds (or the SLSQP fallback's
+    mid-portions scaled by 0.95-1.05), +-0.5 g rounding per ingredient, and
+    amounts that may round below 3 g counted as dropped. The lower bound only
+    counts the first 4 known ingredients, since the fallback after a solver
+    exception keeps only those. A recipe whose range misses 95-105% of the
+    meal target cannot be accepted, so its solve is skipped.
+
+    For a table loaded from disk the ranges are saved in its directory and
+    memory-mapped afterwards.
+    """
+
+    def __init__(self, ingredient_table, nutrients=None):
+        nutrients = nutrients or default_nutrients
+        path = None
+        if ingredient_table.path is not None and ingredient_table.nutrient_hash == nutrients.hash:
+            path = os.path.join(ingredient_table.path, f'calorie_ranges.v{SCREEN_RANGES_VERSION}.npy')
+        if path is not None and os.path.exists(path):
+            ranges = np.load(path, mmap_mode='r')
+        else:
+            ranges = self.calorie_ranges(ingredient_table, nutrients)
+            if path is not None:
+                save_array(path, ranges)
+        self.min_calories, self.max_calories = ranges[0], ranges[1]
+        self.stats = ScreenStats()
+
+    @staticmethod
+    def calorie_ranges(ingredient_table, nutrients):
+        """
+        (min, max) calories of every recipe per scale class, shape (2, 3, recipes)
+        """
+        nutrient_table, portion_bounds = nutrients.table, nutrients.bounds
+        rows = np.array([nutrient_table.index.get(f.lower(), -1) for f in ingredient_table.foods])
+        known = rows >= 0
+        calories = np.where(known, nutrient_table.matrix[np.maximum(rows, 0), 0], 0.0)
+
+        # Per scale class and food: grams range, then calories range
+        min_g, max_g = portion_bounds.scaled(np.maximum(rows, 0), np.array(PORTION_SCALE_TARGETS)[:, None])
+        mid = (min_g + max_g) / 2
+        low_g, high_g = np.minimum(min_g, 0.95 * mid), np.maximum(max_g, 1.05 * mid)
+        low = np.where(low_g < 3.5, 0.0, (low_g - 0.5) * calories / 100)
+        high = (high_g + 0.5) * calories / 100
+
+        # Per recipe: sum over its ingredient entries; the minimum only over its
+        # first 4 known ones (what the exception fallback of optimize_ingredient_weights keeps)
+        indptr, indices = ingredient_table.indptr, ingredient_table.indices
+        recipe_of_entry = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        known_before = np.concatenate(([0], np.cumsum(known[indices])))
+        rank = known_before[:-1] - known_before[indptr[recipe_of_entry]]
+        low = np.where(rank < 4, low[:, indices], 0.0)
+        high = high[:, indices]
+        return np.stack([
+            [np.bincount(recipe_of_entry, weights=bound[c], minlength=len(indptr) - 1)
+             for c in range(len(bound))]
+            for bound in (low, high)
+        ])
+
+    def ranges(self, recipe_ids):
+        """
+        (min, max) calories per scale class for the given recipes, each (3, n)
+        """
+        return self.min_calories[:, recipe_ids], self.max_calories[:, recipe_ids]
+
+class ScreenStats:
+    """
+    Counters for the pre-screen; time saved is estimated from the mean solve time
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.screened = self.rejected = self.solved = 0
+        self.solve_seconds = 0.0
+
+    def record(self, screened, rejected, solved, solve_seconds):
+        with self.lock:
+            self.screened += screened
+            self.rejected += rejected
+            self.solved += solved
+            self.solve_seconds += solve_seconds
+
+    def snapshot(self):
+        with self.lock:
+            mean_solve = self.solve_seconds / self.solved if self.solved else 0.0
+            return {
+                'screened': self.screened,
+                'rejected': self.rejected,
+                'rejection_rate': round(self.rejected / self.screened, 4) if self.screened else 0.0,
+                'solved': self.solved,
+                'mean_solve_ms': round(mean_solve * 1e3, 3),
+                'estimated_seconds_saved': round(self.rejected * mean_solve, 3),
+            }
+
+# -------------------------------------------
+# Meal Targets
+# -------------------------------------------
+# Candidates solved together per batch when suggest_diet runs with solver='lsq'
+LSQ_BATCH_SIZE = 8
+
+def meal_calorie_target(calories_remaining, meals_remaining):
+    """
+    Target calories for the next meal, within realistic meal limits (200-800 kcal)
+    """
+    if meals_remaining > 0:
+        return min(max(200, calories_remaining / meals_remaining), 800)
+    return min(max(200, calories_remaining), 800)
+
+def meal_target_macros(target_calories):
+    """
+    Proportional macros for a meal: calories, protein, fat, carbs, fiber
+    """
+    return [
+        target_calories,
+        target_calories * 0.25 / 4,  # protein (25% of calories)
+        target_calories * 0.25 / 9,  # fat (25% of calories)
+        target_calories * 0.5 / 4,   # carbs (50% of calories)
+        target_calories * 0.035      # fiber (~35g per 1000 kcal)
+    ]
+
+# -------------------------------------------
+# Main Function with Accuracy Constraints
+# -------------------------------------------
+def filter_candidates(user_input, recipe_df, exclude_recipe_names=None, exclude_recipe_ids=None, condition_mask=None):
+    """
+    (store, partition, keep): the user's (Type, meal_type) partition and a
+    boolean mask of its recipes passing the exclusions and health filters.
+    partition is None when no recipe can be suggested.
+    """
+    if isinstance(recipe_df, RecipeStore):
+        store = recipe_df
+    else:
+        store = RecipeStore(recipe_df[
+            (recipe_df['Type'].str.lower() == user_input['Type'].lower()) &
+            (recipe_df['MealType'].str.lower() == user_input['meal_type'].lower())
+        ])
+
+    partition = store.partition(user_input['Type'], user_input['meal_type'])
+    if partition is None:
+        return store, None, None
+
+    df = partition.frame
+    keep = np.ones(len(df), dtype=bool)
 
     if exclude_recipe_names:
-        df = df[~df['Name'].isin(exclude_recipe_names)]
+        keep &= ~df['Name'].isin(exclude_recipe_names).to_numpy()
+    if exclude_recipe_ids is not None and len(exclude_recipe_ids):
+        keep &= store.exclusion_mask(partition, exclude_recipe_ids)
     
     # Apply health condition filters
-    for cond in [c.lower() for c in user_input.get('health_conditions', [])]:
-        if cond == 'diabetes':
-            df = df[df['SugarContent'] <= 10]
-        elif cond == 'hypertension':
-            df = df[df['SodiumContent'] <= 400]
-        elif cond == 'asthma':
-            df = df[~df['RecipeInstructions'].astype(str).str.contains('dairy', na=False, case=False)]
-        elif cond == 'allergy':
-            for allergen in [a.lower() for a in user_input.get('allergies', [])]:
-                df = df[~df['RecipeInstructions'].astype(str).str.contains(allergen, na=False, case=False)]
-                if 'RecipeIngredientParts' in df.columns:
-                    df = df[~df['RecipeIngredientParts'].astype(str).str.contains(allergen, na=False, case=False)]
-
-    if df.empty:
-        return {
-            "bmr": None, "bmi": None, "tdee": None,
-            "calorie_target": None, "actual_calories": 0, "diet_plan": []
-        }
+    if condition_mask is None:
+        condition_mask = store.condition_mask(
+            partition, user_input.get('health_conditions', []), user_input.get('allergies', [])
+        )
+    keep &= condition_mask
+
+    if not keep.any():
+        return store, None, None
+    return store, partition, keep
+
+def diet_plan_events(user_input: dict, recipe_df, max_meals: int = 5, tolerance: float = 0.05,
+                     exclude_recipe_names: list = None, exclude_recipe_ids: list = None,
+                     ingredient_table: IngredientTable = None, solver: str = 'slsqp', portion_cache: PortionCache = None,
+                     condition_mask: np.ndarray = None, feasibility: FeasibilityScreen = None,
+                     timer: StageTimer = None, executor=None, speculate: int = 0, nutrients: NutrientData = None):
+
+    """
+    Diet plan with accuracy constraints (95-105%), produced as it is computed.
+
+    Yields (event, data) pairs: ('plan', {bmr, bmi, tdee, calorie_target})
+    first, then ('meal', meal) for each meal as soon as it is accepted, then
+    ('summary', {actual_calories[, calorie_accuracy]}). suggest_diet() collects
+    them into one plan; the streaming endpoint sends them one by one.
+
+    ``recipe_df`` is either a prepared RecipeStore (what the API passes) or a raw
+    recipe DataFrame, which is prepared for this call only.
+    When ``ingredient_table`` is given, recipe ingredients are looked up by index
+    label instead of being extracted from the recipe text on every request.
+    ``solver`` picks the portion solver: 'slsqp' (reference) or 'lsq' (batched).
+    ``exclude_recipe_ids`` are recipe ids (the 'RecipeId' of returned meals) to skip.
+    ``portion_cache`` memoizes portion solutions across requests.
+    ``feasibility`` skips candidates whose portion solve cannot reach the meal
+    target (needs ``ingredient_table``, which it must have been built from).
+    ``condition_mask`` is a precomputed RecipeStore.condition_mask() for the
+    user's partition (suggest_diet_batch shares one per group of similar users).
+    ``timer`` (a metrics.StageTimer) collects stage durations and counters.
+    With an ``executor`` (concurrent.futures) and ``speculate`` > 1, SLSQP
+    solves the next ``speculate`` ranked candidates concurrently while still
+    accepting in rank order, so the plan is the same as without it (see
+    SpeculativeSolves); the 'lsq' solver already solves candidates in batches.
+    ``nutrients`` is the NutrientData to use (default_nutrients when None);
+    ``ingredient_table`` and ``feasibility`` must have been built from it.
+    """
+    # Validate input
+    validate_user_input(user_input)
+    if timer is None:
+        timer = NULL_TIMER
+
+    # ---------------- Filters ----------------
+    with timer.stage('filter'):
+        store, partition, keep = filter_candidates(
+            user_input, recipe_df, exclude_recipe_names, exclude_recipe_ids, condition_mask
+        )
+    if partition is None:
+        yield 'plan', {"bmr": None, "bmi": None, "tdee": None, "calorie_target": None}
+        yield 'summary', {"actual_calories": 0}
+        return
+    df = partition.frame
 
     # ---------------- Calculations ----------------
     bmr = calculate_bmr(user_input['weight_kg'], user_input['height_cm'], user_input['age'], user_input['gender'])
@@ -557,125 +1151,211 @@ def suggest_diet(user_input: dict, recipe_df: pd.DataFrame, max_meals: int = 5,
     
     cal_target = round(calorie_target(tdee, goal_key), 2)
     bmi = calculate_bmi(user_input['weight_kg'], user_input['height_cm'])
+    yield 'plan', {"bmr": round(bmr, 2), "bmi": bmi, "tdee": tdee, "calorie_target": cal_target}
 
     # ---------------- Nutrition Vector ----------------
-    df = df.dropna(subset=nutrient_cols)
-    df[nutrient_cols] = df[nutrient_cols].apply(pd.to_numeric, errors='coerce')
-    df = df.dropna(subset=nutrient_cols)
-
-    target_vec = [
-        cal_target,
-        cal_target * 0.25 / 9,  # fat
-        cal_target * 0.5 / 4,   # carbs
-        cal_target * 0.25 / 4,  # protein
-        cal_target * 0.035      # fiber
-    ]
+    target_vec = nutrition_target_vector(cal_target)
 
-    scaler = MinMaxScaler()
-    scaled = scaler.fit_transform(df[nutrient_cols])
-    sim = cosine_similarity([scaler.transform([target_vec])[0]], scaled)[0]
-    df['similarity'] = sim
+    # Partition vectors were scaled and normalized at load time (see similarity_index)
+    with timer.stage('rank'):
+        candidates = np.flatnonzero(keep)
+        ranked = partition.index.ranked(target_vec, candidates, batch_size=4 * max_meals)
+        first = next(ranked, None)  # the first batch is scored here
+        ranked = chain([first], ranked) if first is not None else ranked
 
     # ---------------- Meal Selection & Optimization ----------------
-    diet, kcal_sum = [], 0
-    
-    for meal_index, (_, row) in enumerate(df.sort_values('similarity', ascending=False).iterrows()):
-        if len(diet) >= max_meals:
-            break
-            
-        # Calculate target calories for THIS meal with accuracy bounds
-        meals_remaining = max_meals - meal_index
+    accepted, kcal_sum = 0, 0
+    speculative = executor is not None and speculate > 1 and solver != 'lsq'
+    solve_batch_size = LSQ_BATCH_SIZE if solver == 'lsq' else speculate if speculative else 1
+    meal_index = 0
+
+    # Achievable calorie ranges of all candidates, looked up once
+    screen = feasibility if feasibility is not None and ingredient_table is not None else None
+    if screen is not None:
+        min_calories, max_calories = screen.ranges(df.index.to_numpy()[candidates])
+
+    while accepted < max_meals:
         calories_remaining = max(0, cal_target - kcal_sum)
-        
+
         # Stop if we've hit our target (with tolerance)
         if calories_remaining <= cal_target * tolerance:
             break
-            
-        # Target calories for this specific meal (with 95-105% bounds)
-        if meals_remaining > 0:
-            target_calories_this_meal = min(
-                max(200, calories_remaining / meals_remaining),
-                800
+
+        # Targets assume no meal in the chunk gets accepted; candidates after an
+        # accepted one are put back and solved again against the new totals.
+        # Candidates failing the pre-screen still use up their attempt, exactly
+        # as if they had been solved and rejected.
+        chunk, chunk_targets, feasible = [], [], []
+        screened = rejected = 0
+        while len(feasible) < solve_batch_size:
+            rank_pos = next(ranked, None)
+            if rank_pos is None:
+                break
+            target = meal_calorie_target(calories_remaining, max_meals - (meal_index + len(chunk)))
+            ok = True
+            if screen is not None:
+                c = portion_scale_class(target)
+                ok = min_calories[c, rank_pos] <= 1.05 * target and max_calories[c, rank_pos] >= 0.95 * target
+                screened += 1
+                rejected += not ok
+            if ok:
+                feasible.append(len(chunk))
+            chunk.append(rank_pos)
+            chunk_targets.append(target)
+        if not chunk:
+            break
+
+        # Materialize only the candidates actually examined
+        chunk_ids, chunk_rows, chunk_ings = [], [], []
+        with timer.stage('extract'):
+            for rank_pos in (chunk[j] for j in feasible):
+                pos = candidates[rank_pos]
+                recipe_id, row = df.index[pos], store.row(partition.start + pos)
+                chunk_ids.append(int(recipe_id))
+                chunk_rows.append(row)
+
+                # Extract ingredients from recipe
+                if ingredient_table is not None:
+                    chunk_ings.append(ingredient_table.lookup(recipe_id))
+                else:
+                    chunk_ings.append(extract_ingredients(row, nutrients))
+
+        # Optimize with accuracy constraints
+        chunk_names = [row['Name'] for row in chunk_rows]
+        if speculative:
+            # Solves run on the executor and are waited for one by one below
+            solved = SpeculativeSolves(
+                executor, chunk_ings, [chunk_targets[j] for j in feasible], chunk_names, solver, portion_cache, timer,
+                nutrients,
             )
         else:
-            target_calories_this_meal = min(
-                max(200, calories_remaining),
-                800
+            start = time.perf_counter()
+            solved = solve_meal_portions(
+                chunk_ings, [chunk_targets[j] for j in feasible], chunk_names, solver, portion_cache, timer, nutrients
             )
-        
-        # Calculate proportional macros for this meal
-        target_macros = [
-            target_calories_this_meal,
-            target_calories_this_meal * 0.25 / 4,  # protein (25% of calories)
-            target_calories_this_meal * 0.25 / 9,  # fat (25% of calories) 
-            target_calories_this_meal * 0.5 / 4,   # carbs (50% of calories)
-            target_calories_this_meal * 0.035      # fiber (~35g per 1000 kcal)
-        ]
-        
-        # Extract ingredients from recipe
-        found_ings = extract_ingredients(row)
-        
-        # Optimize with accuracy constraints
-        optimized_quantities = optimize_ingredient_weights(
-            found_ings, target_macros, row['Name'], target_calories_this_meal
-        )
-        
-        # Calculate actual nutrition from optimized ingredients
-        actual_nutrition = calculate_actual_nutrition(optimized_quantities)
-        
-        # Only add meal if it's within our accuracy bounds (95-105%)
-        calorie_ratio = actual_nutrition['calories'] / target_calories_this_meal if target_calories_this_meal > 0 else 1
-        if 0.95 <= calorie_ratio <= 1.05 and len(optimized_quantities) > 0:
-            # Inject quantities into instructions
-            instructions_with_quantities = inject_quantities_into_instructions(
-                row.get('RecipeInstructions', ''), optimized_quantities
-            )
-            
-            diet.append({
-                'Name': row['Name'],
-                'Target Calories': round(target_calories_this_meal, 1),
-                'Actual Calories': round(actual_nutrition['calories'], 1),
-                'Calories (kcal)': round(actual_nutrition['calories'], 1),
-                'Protein (g)': round(actual_nutrition['protein'], 1),
-                'Fat (g)': round(actual_nutrition['fat'], 1),
-                'Carbs (g)': round(actual_nutrition['carbs'], 1),
-                'Fiber (g)': round(actual_nutrition['fiber'], 1),
-                'Sugar (g)': round(row.get('SugarContent', 0), 1),
-                'Sodium (mg)': round(row.get('SodiumContent', 0), 1),
-                'Image': get_image_url(row.get('Images')),
-                'Optimized Ingredients': list(optimized_quantities.values()),
-                'Instructions': instructions_with_quantities,
-                'Calorie Match %': round(calorie_ratio * 100, 1)
-            })
-            
-            kcal_sum += actual_nutrition['calories']
-            
-            # Early exit if we're close to target
-            if kcal_sum >= cal_target * (1 - tolerance):
-                break
+            solve_time = time.perf_counter() - start
+            timer.add('solve', solve_time)
+            if screen is not None:
+                screen.stats.record(screened, rejected, len(solved), solve_time)
+        timer.count('candidates_examined', len(chunk))
 
-    # If no meals found, return empty list
-    if not diet:
-        return {
-            "bmr": round(bmr, 2),
-            "bmi": bmi,
-            "tdee": tdee,
-            "calorie_target": cal_target,
-            "actual_calories": round(kcal_sum, 1),
-            "diet_plan": [],
-            "calorie_accuracy": 0
-        }
+        chunk_start = meal_index
+        meal_index += len(chunk)
+        for k, (i, row, (ing_rows, ing_grams)) in enumerate(zip(feasible, chunk_rows, solved)):
+            target_calories_this_meal = chunk_targets[i]
 
-    return {
-        "bmr": round(bmr, 2),
-        "bmi": bmi,
-        "tdee": tdee,
-        "calorie_target": cal_target,
+            # Calculate actual nutrition from optimized ingredients
+            actual_nutrition = calculate_actual_nutrition(ing_rows, ing_grams, nutrients)
+
+            # Only add meal if it's within our accuracy bounds (95-105%)
+            calorie_ratio = actual_nutrition['calories'] / target_calories_this_meal if target_calories_this_meal > 0 else 1
+            if 0.95 <= calorie_ratio <= 1.05 and len(ing_rows) > 0:
+                optimized_quantities = format_quantities(ing_rows, ing_grams, nutrients)
+
+                # Inject quantities into instructions
+                with timer.stage('inject'):
+                    instructions_with_quantities = inject_quantities_into_instructions(
+                        row.get('RecipeInstructions', ''), optimized_quantities
+                    )
+
+                meal = {
+                    'RecipeId': chunk_ids[k],
+                    'Name': row['Name'],
+                    'Target Calories': round(target_calories_this_meal, 1),
+                    'Actual Calories': round(actual_nutrition['calories'], 1),
+                    'Calories (kcal)': round(actual_nutrition['calories'], 1),
+                    'Protein (g)': round(actual_nutrition['protein'], 1),
+                    'Fat (g)': round(actual_nutrition['fat'], 1),
+                    'Carbs (g)': round(actual_nutrition['carbs'], 1),
+                    'Fiber (g)': round(actual_nutrition['fiber'], 1),
+                    'Sugar (g)': round(float(row.get('SugarContent', 0)), 1),
+                    'Sodium (mg)': round(float(row.get('SodiumContent', 0)), 1),
+                    'Image': get_image_url(row.get('Images')),
+                    'Optimized Ingredients': list(optimized_quantities.values()),
+                    'Instructions': instructions_with_quantities,
+                    'Calorie Match %': round(calorie_ratio * 100, 1)
+                }
+
+                accepted += 1
+                kcal_sum += actual_nutrition['calories']
+                timer.count('meals_accepted')
+                meal_index = chunk_start + i + 1
+                ranked = chain(chunk[i + 1:], ranked)
+                if speculative:
+                    solved.cancel()  # the rest of the chunk is solved again against the new totals
+                yield 'meal', meal
+                break
+        if speculative and screen is not None:
+            screen.stats.record(screened, rejected, solved.solved, solved.solve_seconds)
+
+    yield 'summary', {
         "actual_calories": round(kcal_sum, 1),
-        "diet_plan": diet,
-        "calorie_accuracy": round((kcal_sum / cal_target) * 100, 1) if cal_target > 0 else 0
+        "calorie_accuracy": round((kcal_sum / cal_target) * 100, 1) if accepted and cal_target > 0 else 0
     }
 
+def suggest_diet(user_input: dict, recipe_df, *args, **kwargs):
+    """
+    Main function that suggests optimized diet plan with accuracy constraints (95-105%).
+    Takes the arguments of diet_plan_events().
+    """
+    plan, meals, summary = {}, [], {}
+    for event, data in diet_plan_events(user_input, recipe_df, *args, **kwargs):
+        if event == 'meal':
+            meals.append(data)
+        elif event == 'plan':
+            plan = data
+        else:
+            summary = data
+    plan = dict(plan, actual_calories=summary['actual_calories'], diet_plan=meals)
+    if 'calorie_accuracy' in summary:
+        plan['calorie_accuracy'] = summary['calorie_accuracy']
+    return plan
+
+def batch_group_key(user_input):
+    """
+    Users with the same key share a partition and health-condition filtering
+    """
+    return (
+        str(user_input.get('Type', '')).lower(),
+        str(user_input.get('meal_type', '')).lower(),
+        tuple(sorted({c.lower() for c in user_input.get('health_conditions', [])})),
+        tuple(sorted({a.lower() for a in user_input.get('allergies', [])})),
+    )
+
+def suggest_diet_batch(user_inputs: list, store: RecipeStore, exclude_recipe_names: list = None,
+                       exclude_recipe_ids: list = None, **kwargs):
+    """
+    Diet plans for many users, generated group by group.
+
+    Users are grouped by (Type, meal_type, health conditions) so each group's
+    partition lookup and health-condition filtering run once. Yields
+    (index, plan, error) as each plan is finished, where exactly one of plan
+    and error is None; a failing user does not affect the others.
+    """
+    groups = {}
+    for i, user_input in enumerate(user_inputs):
+        groups.setdefault(batch_group_key(user_input), []).append(i)
+
+    for indices in groups.values():
+        first = user_inputs[indices[0]]
+        partition = store.partition(first.get('Type', ''), first.get('meal_type', ''))
+        mask = store.condition_mask(
+            partition, first.get('health_conditions', []), first.get('allergies', [])
+        ) if partition is not None else None
+
+        for i in indices:
+            try:
+                plan = suggest_diet(
+                    user_inputs[i], store,
+                    exclude_recipe_names=exclude_recipe_names[i] if exclude_recipe_names else None,
+                    exclude_recipe_ids=exclude_recipe_ids[i] if exclude_recipe_ids else None,
+                    condition_mask=mask, **kwargs
+                )
+            except Exception as e:
+                yield i, None, str(e)
+            else:
+                yield i, plan, None
+
 
 
 #     
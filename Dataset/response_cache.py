@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# -------------------------------------------
+# /recommend response cache
+# -------------------------------------------
+def normalize_profile(user_input, precision=1):
+    """
+    Canonical form of a recommendation request.
+
+    Strings that the pipeline compares case-insensitively are lowercased,
+    health conditions, allergies and excluded names/ids are sorted, and the BMR/TDEE inputs
+    (height and weight) are rounded to ``precision`` decimals.
+    """
+    exclude_ids = user_input.get('exclude_recipe_ids')  # a list, or an array when merged from a bitmap
+    return {
+        'gender': 1 if user_input['gender'] else 0,
+        'age': int(user_input['age']),
+        'height_cm': round(float(user_input['height_cm']), precision),
+        'weight_kg': round(float(user_input['weight_kg']), precision),
+        'goal': str(user_input['goal']).strip().lower(),
+        'Type': str(user_input['Type']).strip().lower(),
+        'meal_type': str(user_input['meal_type']).strip().lower(),
+        'health_conditions': sorted({c.strip().lower() for c in user_input.get('health_conditions') or []}),
+        'activity_type': str(user_input['activity_type']).strip().lower(),
+        'exclude_recipe_names': sorted(set(user_input.get('exclude_recipe_names') or [])),
+        'exclude_recipe_ids': sorted({int(i) for i in (exclude_ids if exclude_ids is not None else [])}),
+        'allergies': sorted({a.strip().lower() for a in user_input.get('allergies') or []}),
+    }
+
+def profile_key(profile):
+    return hashlib.sha256(json.dumps(profile, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+class ResponseCache:
+    """
+    Size-bounded LRU of serialized /recommend responses, with an optional
+    directory of JSON files as a second tier.
+
+    Entries belong to a dataset ``version``; set_version() with a new value
+    drops the in-process tier, and file entries written for another version
+    are ignored (and overwritten) on lookup.
+    """
+
+    def __init__(self, maxsize=1024, directory=None, version=''):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.version = version
+        self.entries = OrderedDict()  # key -> JSON text
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def set_version(self, version):
+        """
+        Invalidate everything cached for other dataset versions
+        """
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.entries.clear()
+
+    def file_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        with self.lock:
+            text = self.entries.get(key)
+            if text is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(text)
+            version = self.version
+
+        if self.directory:
+            try:
+                with open(self.file_path(key)) as f:
+                    stored = json.load(f)
+            except (OSError, ValueError):
+                stored = None
+            if stored is not None and stored.get('version') == version:
+                self._remember(key, json.dumps(stored['response']))
+                with self.lock:
+                    self.hits += 1
+                return stored['response']
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, response, version=None):
+        """
+        Store a response; ``version`` is the dataset version it was computed
+        against, and responses from a version that has since been replaced are dropped
+        """
+        if version is not None and version != self.version:
+            return
+        text = json.dumps(response)
+        self._remember(key, text)
+        if self.directory:
+            path = self.file_path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    f.write(f'{{"version": {json.dumps(self.version)}, "response": {text}}}')
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"❌ Could not write response cache file {path}: {e}")
+
+    def _remember(self, key, text):
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'version': self.version,
+            }
@@ -0,0 +1,174 @@
+import numpy as np
+
+# -------------------------------------------
+# Nutrient-profile similarity index
+# -------------------------------------------
+# Upper bound on |float32 score - float64 cosine similarity| for unit
+# vectors of 5 components (the true error is below 1e-6)
+SCORE_ERROR = 1e-5
+# Partitions smaller than this are always ranked exactly
+APPROX_MIN_ROWS = 50_000
+# Cells probed before the first candidates are yielded in approximate mode
+APPROX_PROBES = 8
+
+def unit_rows(values):
+    """
+    Rows scaled to unit L2 norm, computed as sklearn.preprocessing.normalize does (all-zero rows stay zero)
+    """
+    norms = np.sqrt(np.einsum('ij,ij->i', values, values))
+    norms[norms < 10 * np.finfo(norms.dtype).eps] = 1.0
+    return values / norms[:, None]
+
+class SimilarityIndex:
+    """
+    Cosine-similarity ranking of one partition's recipes against a target.
+
+    Rows are scaled with the partition's min-max scaling (``factors`` and
+    ``offsets``, MinMaxScaler's scale_ and min_), L2-normalized and kept
+    as one contiguous float32 matrix with a row per nutrient (5 x N), so
+    scoring a request is a single BLAS matrix-vector product over long
+    contiguous rows. Exact mode uses those scores only to shortlist:
+    the shortlist is rescored in float64 with the same arithmetic as
+    MinMaxScaler.transform() and cosine_similarity(), so the order is the
+    same as ranking everything in float64. sklearn's input validation would
+    cost more than the scoring. ``approximate`` groups the rows of large partitions into
+    spherical k-means cells and scores only the cells nearest the target.
+    """
+
+    ARRAYS = ('factors', 'offsets', 'vectors', 'centroids', 'cell_rows', 'cell_bounds')
+
+    def __init__(self, nutrients, factors, offsets, approximate=False, seed=0):
+        self.nutrients = nutrients  # float64 rows, rescored on demand in exact mode
+        self.factors, self.offsets = factors, offsets
+        self.vectors = np.ascontiguousarray(unit_rows(self.scale(nutrients)).T, dtype=np.float32)
+        self.centroids = self.cell_rows = self.cell_bounds = None
+        if approximate and len(nutrients) >= APPROX_MIN_ROWS:
+            self.build_cells(int(np.sqrt(len(nutrients))), seed)
+
+    def arrays(self):
+        """
+        {name: array} of everything built, for saving; from_arrays() restores the index
+        """
+        return {name: getattr(self, name) for name in self.ARRAYS if getattr(self, name) is not None}
+
+    @classmethod
+    def from_arrays(cls, nutrients, arrays):
+        index = cls.__new__(cls)
+        index.nutrients = nutrients
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays.get(name))
+        return index
+
+    def __len__(self):
+        return self.vectors.shape[1]
+
+    @property
+    def nbytes(self):
+        cells = self.cell_rows.nbytes + self.centroids.nbytes if self.cell_rows is not None else 0
+        return self.vectors.nbytes + cells
+
+    def build_cells(self, n_cells, seed=0, sample_size=20_000, iterations=10, chunk_size=32_768):
+        """
+        Group rows into ``n_cells`` cells by spherical k-means fitted on a sample
+        """
+        rng = np.random.default_rng(seed)
+        sample = self.vectors[:, rng.choice(len(self), min(sample_size, len(self)), replace=False)].T
+        centroids = sample[rng.choice(len(sample), n_cells, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = unit_rows(sums).astype(np.float32)
+
+        labels = np.concatenate([
+            np.argmax(self.vectors[:, i:i + chunk_size].T @ centroids.T, axis=1)
+            for i in range(0, len(self), chunk_size)
+        ])
+        self.centroids = centroids
+        self.cell_rows = np.argsort(labels, kind='stable')
+        self.cell_bounds = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=n_cells))))
+
+    def scale(self, values):
+        return values * self.factors + self.offsets
+
+    def exact_scores(self, target, rows):
+        """
+        float64 cosine similarity of the scaled, normalized ``target`` and partition ``rows``
+        """
+        return np.nan_to_num(unit_rows(self.scale(self.nutrients[rows])) @ target, nan=-2.0)
+
+    def ranked(self, target_vec, candidates, batch_size=20):
+        """
+        Yield positions into ``candidates`` (sorted partition rows), best first.
+
+        Only the best ``batch_size`` rows are ranked at first; the batch doubles
+        each time the consumer asks for more, which only happens when earlier
+        candidates were rejected.
+        """
+        target = unit_rows(self.scale(np.asarray([target_vec], dtype=np.float64)))[0]
+        if self.cell_rows is not None:
+            return self._ranked_cells(target.astype(np.float32), candidates, batch_size)
+        return self._ranked_exact(target, candidates, batch_size)
+
+    def _ranked_exact(self, target, candidates, batch_size):
+        # float32 scores; rows already yielded get -inf
+        approx = target.astype(np.float32) @ self.vectors
+        if len(candidates) < len(approx):
+            approx = approx[candidates]
+        exact = np.zeros(len(candidates))
+        scored = np.zeros(len(candidates), dtype=bool)
+        remaining = len(candidates)
+        while remaining > 0:
+            k = min(batch_size, remaining)
+            if k < remaining:
+                # Every row of the exact top k (ties included) scores at least
+                # kth - SCORE_ERROR, so its float32 score is at least lower
+                kth = float(np.partition(approx, len(approx) - k)[len(approx) - k])
+                lower = kth - 2 * SCORE_ERROR
+                shortlist = np.flatnonzero(approx >= lower)
+            else:
+                lower = -np.inf
+                shortlist = np.flatnonzero(approx != -np.inf)
+            todo = shortlist[~scored[shortlist]]
+            exact[todo] = self.exact_scores(target, candidates[todo])
+            scored[todo] = True
+
+            # Rows outside the shortlist score below lower + SCORE_ERROR, so
+            # everything above that is final; ties keep row order
+            batch = shortlist[exact[shortlist] >= lower + SCORE_ERROR]
+            batch = batch[np.lexsort((batch, -exact[batch]))]
+            yield from batch.tolist()
+
+            approx[batch] = -np.inf
+            remaining -= len(batch)
+            batch_size *= 2
+
+    def _ranked_cells(self, target, candidates, batch_size):
+        cell_order = np.argsort(-(self.centroids @ target), kind='stable')
+        rows, scores = np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.float32)
+        c = 0
+        while c < len(cell_order) or len(rows):
+            # Score the cells nearest the target until the pool holds two batches
+            probed = []
+            while c < len(cell_order) and (c < APPROX_PROBES or len(rows) + sum(map(len, probed)) < 2 * batch_size):
+                cell = cell_order[c]
+                probed.append(self.cell_rows[self.cell_bounds[cell]:self.cell_bounds[cell + 1]])
+                c += 1
+            if probed:
+                probed = np.concatenate(probed)
+                rows = np.concatenate((rows, probed))
+                scores = np.concatenate((scores, target @ self.vectors[:, probed]))
+
+            # Best of the pool first (ties keep row order); rows that are not candidates are dropped
+            k = min(batch_size, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(rows) else np.arange(len(rows))
+            top = top[np.lexsort((rows[top], -scores[top]))]
+            positions = np.searchsorted(candidates, rows[top])
+            found = positions < len(candidates)
+            found[found] = candidates[positions[found]] == rows[top][found]
+            yield from positions[found].tolist()
+
+            rows, scores = np.delete(rows, top), np.delete(scores, top)
+            batch_size *= 2
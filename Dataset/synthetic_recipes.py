@@ -0,0 +1,157 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from recommend import NUTRIENT_PATH
+
+# -------------------------------------------
+# Synthetic recipe corpus
+# -------------------------------------------
+# Same columns as cleaned_recipes.csv (see mergedataset.ipynb), including the
+# RecipeId column and the L2-normalized *_norm copies of the nutrition columns
+NUTRITION_COLUMNS = ['Calories', 'FatContent', 'CarbohydrateContent', 'ProteinContent',
+                     'FiberContent', 'SodiumContent', 'SugarContent', 'CholesterolContent']
+RECIPE_COLUMNS = (['RecipeId', 'Name', 'Description', 'Images', 'RecipeInstructions', 'Keywords', 'RecipeCategory']
+                  + NUTRITION_COLUMNS + ['Type', 'MealType'] + [c + '_norm' for c in NUTRITION_COLUMNS])
+
+MEAL_TYPES = ['general', 'breakfast', 'lunch', 'dinner', 'snack']
+MEAL_TYPE_WEIGHTS = [0.55, 0.12, 0.1, 0.1, 0.13]
+MEAL_KEYWORDS = {'general': None, 'breakfast': 'Breakfast', 'lunch': 'Lunch', 'dinner': 'Dinner', 'snack': 'Snack'}
+CATEGORIES = ['one dish meal', 'vegetable', 'chicken', 'dessert', 'breads', 'beverages', 'lunch/snacks',
+              'pork', 'sauces', 'quick breads', 'potato', 'low protein', 'very low carbs', 'beans']
+KEYWORDS = ['Easy', '< 30 Mins', '< 60 Mins', 'Healthy', 'Low Cholesterol', 'High Protein', 'Inexpensive',
+            'Kid Friendly', 'Weeknight', 'Oven', 'Stove Top', 'Free Of...']
+STYLES = ['easy', 'quick', 'spicy', 'creamy', 'roasted', 'grilled', 'healthy', 'classic', 'rustic', 'baked']
+DISHES = ['salad', 'soup', 'bowl', 'bake', 'stir fry', 'casserole', 'wrap', 'skillet', 'stew', 'smoothie']
+STEPS = [
+    'Chop the {food}.',
+    'Add the {food} and cook for {minutes} minutes.',
+    'Stir in {food}.',
+    'Mix {food} in a large bowl.',
+    'Saute {food} over medium heat for {minutes} minutes.',
+    'Fold in the {food} and season with salt and pepper.',
+]
+MAX_INGREDIENTS = 9
+# Outlier caps applied by mergedataset.ipynb
+MAX_THRESHOLDS = {'Calories': 5000, 'FatContent': 500, 'CarbohydrateContent': 1000, 'ProteinContent': 500,
+                  'FiberContent': 200, 'SodiumContent': 10000, 'SugarContent': 1000, 'CholesterolContent': 1000}
+
+def generate_recipes(rows, seed=0, start=0, nutrient_df=None):
+    """
+    DataFrame of ``rows`` synthetic recipes in the cleaned_recipes.csv schema.
+
+    Each recipe mixes 3-9 foods of the nutrient table; its nutrition columns
+    are per serving and derived from the foods' per-100g values, so recipes
+    rank and solve like real ones. ``start`` offsets recipe numbering so
+    chunks of a large corpus get distinct names and ids.
+    """
+    if nutrient_df is None:
+        nutrient_df = pd.read_csv(NUTRIENT_PATH)
+    rng = np.random.default_rng([seed, start])
+    foods = nutrient_df['food'].str.lower().tolist()
+    per_100g = nutrient_df[['calories', 'fat', 'carbs', 'protein', 'fiber', 'sodium']].fillna(0).to_numpy()
+
+    counts = rng.integers(3, MAX_INGREDIENTS + 1, rows)
+    used = np.arange(MAX_INGREDIENTS) < counts[:, None]
+    food_ids = rng.integers(0, len(foods), (rows, MAX_INGREDIENTS))
+    grams = np.where(used, rng.uniform(20, 200, (rows, MAX_INGREDIENTS)), 0.0)
+    servings = rng.integers(1, 7, rows)
+    # calories, fat, carbs, protein, fiber, sodium per serving
+    nutrition = np.einsum('ij,ijk->ik', grams / 100, per_100g[food_ids]) / servings[:, None]
+    sugar = np.minimum(rng.gamma(1.5, 6.0, rows), nutrition[:, 2])
+    cholesterol = np.where(rng.random(rows) < 0.4, 0.0, rng.gamma(2.0, 30.0, rows))
+
+    meal_types = rng.choice(MEAL_TYPES, rows, p=MEAL_TYPE_WEIGHTS)
+    styles = rng.integers(0, len(STYLES), rows)
+    dishes = rng.integers(0, len(DISHES), rows)
+    steps = rng.integers(0, len(STEPS), (rows, MAX_INGREDIENTS))
+    minutes = rng.integers(2, 45, (rows, MAX_INGREDIENTS))
+    keywords = rng.random((rows, len(KEYWORDS))) < 0.25
+
+    names, descriptions, images, instructions, keyword_lists = [], [], [], [], []
+    for i in range(rows):
+        recipe_foods = list(dict.fromkeys(foods[f] for f in food_ids[i, :counts[i]]))
+        style, dish = STYLES[styles[i]], DISHES[dishes[i]]
+        names.append(f"{style} {recipe_foods[0]} {dish} {start + i}")
+        descriptions.append(f"a {style} {dish} with {' and '.join(recipe_foods[:2])}.")
+        images.append(repr([f"https://img.example.com/recipes/{start + i}.jpg"]))
+        instructions.append(repr(
+            [STEPS[s].format(food=food, minutes=m) for food, s, m in zip(recipe_foods, steps[i], minutes[i])]
+            + ['Serve warm.']
+        ))
+        words = [k for k, on in zip(KEYWORDS, keywords[i]) if on]
+        if MEAL_KEYWORDS[meal_types[i]]:
+            words.append(MEAL_KEYWORDS[meal_types[i]])
+        keyword_lists.append(repr(words))
+
+    df = pd.DataFrame({
+        'RecipeId': start + np.arange(rows),
+        'Name': names,
+        'Description': descriptions,
+        'Images': images,
+        'RecipeInstructions': instructions,
+        'Keywords': keyword_lists,
+        'RecipeCategory': rng.choice(CATEGORIES, rows),
+        'Calories': nutrition[:, 0].round(1),
+        'FatContent': nutrition[:, 1].round(1),
+        'CarbohydrateContent': nutrition[:, 2].round(1),
+        'ProteinContent': nutrition[:, 3].round(1),
+        'FiberContent': nutrition[:, 4].round(1),
+        'SodiumContent': nutrition[:, 5].round(1),
+        'SugarContent': sugar.round(1),
+        'CholesterolContent': cholesterol.round(1),
+        'Type': rng.choice(['vegetarian', 'non-vegetarian'], rows),
+        'MealType': meal_types,
+    })
+    for column, cap in MAX_THRESHOLDS.items():
+        df[column] = df[column].clip(upper=cap)
+    values = df[NUTRITION_COLUMNS].to_numpy()
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    normalized = values / np.where(norms > 0, norms, 1.0)
+    for j, column in enumerate(NUTRITION_COLUMNS):
+        df[column + '_norm'] = normalized[:, j]
+    return df[RECIPE_COLUMNS]
+
+def write_recipes(path, rows, seed=0, chunk_size=100_000):
+    """
+    Write a synthetic corpus to ``path`` chunk by chunk, so memory stays
+    bounded for corpora of millions of recipes
+    """
+    nutrient_df = pd.read_csv(NUTRIENT_PATH)
+    tmp_path = path + '.tmp'
+    for start in range(0, rows, chunk_size):
+        chunk = generate_recipes(min(chunk_size, rows - start), seed, start, nutrient_df)
+        chunk.to_csv(tmp_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+def corpus_path(directory, rows, seed=0):
+    return os.path.join(directory, f"synthetic_recipes_{rows}_{seed}.csv")
+
+def ensure_corpus(directory, rows, seed=0):
+    """
+    Path of the synthetic corpus with ``rows`` recipes, generating it if missing
+    """
+    path = corpus_path(directory, rows, seed)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        start = time.perf_counter()
+        write_recipes(path, rows, seed)
+        print(f"🔄 Generated {rows} synthetic recipes -> {path} ({time.perf_counter() - start:.1f}s)")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic recipe corpus in the cleaned_recipes.csv schema")
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    path = args.output or f"synthetic_recipes_{args.rows}_{args.seed}.csv"
+    start = time.perf_counter()
+    write_recipes(path, args.rows, args.seed)
+    print(f"✅ {args.rows} recipes -> {path} ({time.perf_counter() - start:.1f}s)")
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from dataset_snapshot import dataset_version
+from metrics import StageTimer
+from portion_cache import PortionCache
+from recipe_data import load_recipe_dataset, read_recipes
+from recipe_store import RecipeStore, load_recipe_store
+from recommend import FeasibilityScreen, default_nutrients, file_hash, load_ingredient_table, suggest_diet, warm_solver
+
+# -------------------------------------------
+# Worker process side
+# -------------------------------------------
+# Set once per worker by init_worker(); requests only read it
+_worker = {}
+
+def detach_signals():
+    # Forked workers inherit the server's signal handlers; shutdown is driven by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+def init_worker(recipe_path, recipe_format, solver, portion_cache_size, similarity='exact', nutrients=None):
+    """
+    Load the recipe data into this worker process (runs once per process)
+    """
+    detach_signals()
+    nutrients = nutrients or default_nutrients
+    recipe_hash = file_hash(recipe_path)
+    if recipe_format == 'csv':
+        recipe = read_recipes(recipe_path)
+        _worker['store'] = RecipeStore(recipe, similarity=similarity)
+        _worker['store'].token_index
+    else:
+        recipe, recipe_text = load_recipe_dataset(recipe_path, recipe_hash)
+        _worker['store'] = load_recipe_store(recipe_path, recipe, recipe_text, recipe_hash, similarity)
+    _worker['ingredient_table'] = load_ingredient_table(recipe_path, recipe if recipe_format == 'csv' else None,
+                                                        nutrients)
+    _worker['feasibility'] = FeasibilityScreen(_worker['ingredient_table'], nutrients)
+    _worker['nutrients'] = nutrients
+    _worker['version'] = dataset_version(_worker['ingredient_table'].recipe_hash, nutrients.hash, similarity)
+    _worker['solver'] = solver
+    _worker['portion_cache'] = PortionCache(maxsize=portion_cache_size) if portion_cache_size > 0 else None
+    warm_solver(solver)
+
+def init_solve_worker():
+    detach_signals()
+    warm_solver('slsqp')  # every job on this executor is an SLSQP solve
+
+def worker_ready(delay):
+    time.sleep(delay)  # hold this worker so the other warm-up calls land on the others
+    return os.getpid(), _worker.get('version')
+
+def run_suggest_diet(input_data, exclude_recipe_names, exclude_recipe_ids, timed=False):
+    """
+    (plan, timer); the StageTimer is None unless ``timed``
+    """
+    timer = StageTimer() if timed else None
+    plan = suggest_diet(
+        input_data, _worker['store'], exclude_recipe_names=exclude_recipe_names, exclude_recipe_ids=exclude_recipe_ids,
+        ingredient_table=_worker['ingredient_table'], feasibility=_worker['feasibility'], solver=_worker['solver'],
+        portion_cache=_worker['portion_cache'], timer=timer, nutrients=_worker['nutrients'],
+    )
+    return plan, timer
+
+# -------------------------------------------
+# API side
+# -------------------------------------------
+class PoolBusy(Exception):
+    pass
+
+class RecommendPool:
+    """
+    Pre-warmed process pool running suggest_diet outside the API process.
+
+    At most ``max_pending`` jobs are queued or running at once; further
+    requests raise PoolBusy immediately instead of waiting. A request that
+    takes longer than ``timeout`` seconds raises asyncio.TimeoutError. A
+    timed-out job that already started keeps its worker busy until it
+    finishes, since worker processes cannot be interrupted safely, and it
+    counts as pending until then.
+    Workers load the files themselves, with the nutrient data of ``nutrients``
+    (a recommend.NutrientData); warm() reports the dataset versions they loaded.
+    """
+
+    def __init__(self, recipe_path, recipe_format='binary', workers=2, max_pending=None, timeout=30.0,
+                 solver='slsqp', portion_cache_size=10000, similarity='exact', nutrients=None):
+        self.workers = workers
+        self.max_pending = max_pending or 4 * workers
+        self.timeout = timeout
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=init_worker,
+            initargs=(recipe_path, recipe_format, solver, portion_cache_size, similarity, nutrients),
+        )
+
+    def warm(self):
+        """
+        Start every worker and wait until each has loaded its data; returns the set of dataset versions loaded
+        """
+        ready = set(self.executor.map(worker_ready, [0.1] * self.workers))
+        print(f"🔄 Recommendation workers ready: {len(ready)} processes")
+        return {version for _, version in ready}
+
+    async def suggest_diet(self, input_data, exclude_recipe_names=None, exclude_recipe_ids=None, timed=False):
+        """
+        (plan, StageTimer or None), see run_suggest_diet()
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise PoolBusy(f"{self.pending} requests already pending")
+            self.pending += 1
+        try:
+            job = self.executor.submit(run_suggest_diet, input_data, exclude_recipe_names, exclude_recipe_ids, timed)
+        except BaseException:
+            self.job_done()
+            raise
+        # Released when the job finishes or is cancelled before it starts, not when the request gives up on it
+        job.add_done_callback(lambda _: self.job_done())
+        return await asyncio.wait_for(asyncio.wrap_future(job), self.timeout)
+
+    def job_done(self):
+        with self.lock:
+            self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+# -------------------------------------------
+# Speculative solve executor
+# -------------------------------------------
+def start_solve_executor(kind='process', workers=2):
+    """
+    Started executor for speculative portion solves (recommend.SpeculativeSolves).
+
+    'process' runs SLSQP in forked worker processes, which inherit the loaded
+    nutrient data; 'thread' only helps where the solver releases the GIL.
+    """
+    if kind == 'thread':
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='solve')
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_solve_worker)
+    for future in [executor.submit(worker_ready, 0.05) for _ in range(workers)]:
+        future.result()
+    return executor